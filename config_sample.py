@@ -3,11 +3,69 @@
  API_HASH = "your_api_hash"
  BOT_TOKEN = "your_bot_token"
  OWNER_ID = "owner_telegram_id"
+ BOT_WORKERS = None  # optional: Pyrogram update workers (None = GEMINI_MAX_CONCURRENCY + GEMINI_QUEUE_LIMIT + 8)
 
  # Gemini Settings
  GEMINI_API_KEY = "your_gemini_api_key"
  GEMINI_MODEL = "gemini-2.0-flash"
+ GEMINI_MAX_CONCURRENCY = 8  # optional: max in-flight Gemini requests
+ GEMINI_TIMEOUT = 60  # optional: per-request timeout in seconds
+ GEMINI_STREAMING = True  # optional: edit the reply progressively while generating
+ STREAM_EDIT_INTERVAL = 1.5  # optional: min seconds between two streaming edits
+ STREAM_EDIT_MIN_CHARS = 60  # optional: min new characters before the next edit
+ GEMINI_CACHE_COMMANDS = ("gemini", "translate", "reply", "inline", "ask")  # optional: commands served from the response cache
+ GEMINI_CACHE_SIZE = 1000  # optional: responses kept in memory
+ GEMINI_CACHE_TTL = 86400  # optional: seconds a cached response stays valid
+ GEMINI_RPM = 60  # optional: global Gemini requests per minute
+ GEMINI_QUEUE_LIMIT = 50  # optional: queued Gemini jobs before new ones are rejected
+ GEMINI_RETRY_ATTEMPTS = 3  # optional: attempts for transient (429/5xx/timeout) errors
+ GEMINI_BREAKER_THRESHOLD = 5  # optional: consecutive failures that open the circuit
+ GEMINI_BREAKER_RESET = 30  # optional: seconds before a half-open probe
+ GEMINI_HEDGING = False  # optional: send a backup request after the p95 latency
+ DB_THREADS = 1  # optional: threads that run database queries off the event loop
+ DB_PRAGMAS = {}  # optional: SQLite pragmas overriding the defaults (WAL, synchronous=NORMAL, 64MB cache, 256MB mmap)
+ DB_MAINTENANCE_INTERVAL = 3600  # optional: seconds between WAL checkpoint / optimize runs
+ BOT_STATUS_REFRESH_INTERVAL = 30  # optional: seconds between checks for on/off changes made by another process (None = off)
+ GEMINI_USER_DAILY_LIMIT = 30  # optional: Gemini requests per user per day
+ GEMINI_QUOTA_FLUSH_INTERVAL = 10  # optional: seconds between writes of usage counters to the database
+ HISTORY_ENABLED = True  # optional: record incoming messages in the Message table
+ HISTORY_QUEUE_SIZE = 10000  # optional: messages buffered before new ones are dropped
+ HISTORY_BATCH_SIZE = 500  # optional: messages written per transaction
+ HISTORY_FLUSH_INTERVAL = 2  # optional: seconds to gather a batch before writing
+ GEMINI_USAGE_RETENTION_DAYS = 90  # optional: daily Gemini usage older than this is merged into monthly totals
+ HISTORY_RETENTION_DAYS = 180  # optional: messages older than this leave the database (None = keep forever)
+ HISTORY_ARCHIVE_DIR = "archive"  # optional: folder for gzip archives of removed messages (None = delete)
+ RETENTION_QUIET_HOURS = (3, 6)  # optional: local hours [start, end) for the daily maintenance run, e.g. (23, 2) wraps midnight
+ GEMINI_RATE_LIMIT = (5, 60)  # optional: requests per user across all Gemini commands, per seconds
+ RATE_LIMIT_EXEMPT_LEVEL = 2  # optional: permission level that bypasses rate limits
+ RATE_LIMIT_EVICT_INTERVAL = 300  # optional: seconds between removals of idle rate limit state
+ PERMISSION_CACHE_SIZE = 10000  # optional: users whose permission level is kept in memory
+ PERMISSION_CACHE_TTL = 600  # optional: seconds a cached permission level is trusted (None = until changed)
+ GOOGLE_DAILY_LIMIT = 100  # optional: Custom Search calls per day for the whole bot
+ GEMINI_DAILY_LIMIT = 1500  # optional: Gemini calls per day for the whole bot
+ GEMINI_DAILY_TOKEN_LIMIT = None  # optional: Gemini tokens per day (None = unlimited)
+ API_SOFT_LIMIT_RATIO = 0.8  # optional: past this share of a budget only API_PRIORITY_LEVEL users get fresh calls
+ API_PRIORITY_LEVEL = 2  # optional: permission level that keeps fresh calls near the limit
+ GROUNDED_SOURCES = 5  # optional: search results used by the "ask" command
+ TRANSLATION_CACHE_TTL = 604800  # optional: seconds translations of a message are kept
+ TRANSLATION_CHUNK_SIZE = 1500  # optional: longer texts are translated in parallel chunks
+ TRANSLATION_PARALLEL_CHUNKS = 2  # optional: chunks of one translation sent at the same time
+
+ # Cache Settings (optional)
+ ANSWER_CACHE_SIZE = 512  # long inline answers kept for paging
+ ANSWER_CACHE_TTL = 21600  # seconds
+ ANSWER_CACHE_PERSISTENT = False  # also keep answers in SQLite
+ INLINE_QUERY_CACHE_SIZE = 5000  # inline query texts kept in memory
+ INLINE_QUERY_CACHE_TTL = 604800  # seconds
+ INLINE_QUERY_PERSISTENT = True  # keep picked queries so "show answer" buttons survive a restart; needs inline feedback (/setinlinefeedback in BotFather), otherwise a query is saved only when its button is first pressed
 
  # Google Search Settings
  GOOGLE_API_KEY = "your_google_api_key"
- GOOGLE_CX = "your_google_cx"
\ No newline at end of file
+ GOOGLE_CX = "your_google_cx"
+ GOOGLE_TIMEOUT = 15  # optional: request timeout in seconds
+ GOOGLE_CONNECT_TIMEOUT = 5  # optional: connect timeout in seconds
+ GOOGLE_MAX_CONNECTIONS = 20  # optional: HTTP connection pool size
+ GOOGLE_MAX_KEEPALIVE = 10  # optional: idle keep-alive connections
+ GOOGLE_CACHE_SIZE = 500  # optional: search results kept in memory
+ GOOGLE_CACHE_TTL = 21600  # optional: seconds a cached search result stays valid
+ GOOGLE_PAGE_SIZE = 5  # optional: results per page
\ No newline at end of file
@@ -0,0 +1,142 @@
+# database\migrations.py
+import logging
+from typing import Callable
+from peewee import fn
+from database.models import db, SchemaVersion, create_message_search
+from utils.converters import PersianTextNormalizer
+
+logger = logging.getLogger(__name__)
+
+# (نسخه، توضیح، تابع) به ترتیب نسخه
+MIGRATIONS: list[tuple[int, str, Callable[[], None]]] = []
+
+
+def migration(version: int, description: str):
+    """
+    ثبت یک مهاجرت
+
+    هر مهاجرت یک بار و در یک تراکنش اجرا می‌شود. در دیتابیس جدید که هنوز
+    جدولی ندارد مهاجرت‌ها کاری انجام نمی‌دهند و create_tables ساختار نهایی را
+    می‌سازد، پس هر مهاجرت باید نبودن جدول را تحمل کند.
+    """
+
+    def decorator(func: Callable[[], None]):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return func
+
+    return decorator
+
+
+def schema_version() -> int:
+    """آخرین نسخه اعمال‌شده"""
+    return SchemaVersion.select(fn.MAX(SchemaVersion.version)).scalar() or 0
+
+
+def run_migrations() -> int:
+    """
+    اعمال مهاجرت‌های جدید (قبل از create_tables اجرا شود)
+
+    Returns:
+        نسخه فعلی ساختار دیتابیس
+    """
+    db.connect(reuse_if_open=True)
+    db.create_tables([SchemaVersion])
+    current = schema_version()
+    for version, description, func in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info(f"Applying migration {version}: {description}")
+        with db.atomic():
+            func()
+            SchemaVersion.create(version=version, description=description)
+        current = version
+    return current
+
+
+def columns(table: str) -> list[str]:
+    return [column.name for column in db.get_columns(table)]
+
+
+def replace_index(table: str, name: str, fields: list[str],
+                  unique: bool = False) -> None:
+    """ساخت مجدد ایندکس با همان نام (مثلاً تبدیل ایندکس عادی به یکتا)"""
+    db.execute_sql(f'DROP INDEX IF EXISTS "{name}"')
+    db.execute_sql(f'CREATE {"UNIQUE " if unique else ""}INDEX "{name}" '
+                   f'ON "{table}" ({", ".join(fields)})')
+
+
+@migration(1, "add botstatus.version")
+def add_bot_status_version():
+    if db.table_exists("botstatus") and "version" not in columns("botstatus"):
+        db.execute_sql("ALTER TABLE botstatus "
+                       "ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+
+@migration(2, "unique (user, date) on geminiusage")
+def unique_gemini_usage():
+    if not db.table_exists("geminiusage"):
+        return
+    # مجموع شمارنده‌های تکراری در قدیمی‌ترین سطر نگه داشته می‌شود
+    db.execute_sql("""
+        UPDATE geminiusage SET count = (
+            SELECT SUM(g.count) FROM geminiusage g
+            WHERE g.user_id = geminiusage.user_id AND g.date = geminiusage.date)
+        WHERE id IN (SELECT MIN(id) FROM geminiusage
+                     GROUP BY user_id, date HAVING COUNT(*) > 1)""")
+    db.execute_sql("""
+        DELETE FROM geminiusage WHERE id NOT IN (
+            SELECT MIN(id) FROM geminiusage GROUP BY user_id, date)""")
+    replace_index("geminiusage", "geminiusage_user_id_date",
+                  ["user_id", "date"], unique=True)
+    # ایندکس (user_id, date) جستجو بر اساس کاربر را هم پوشش می‌دهد
+    db.execute_sql('DROP INDEX IF EXISTS "geminiusage_user_id"')
+
+
+@migration(3, "unique user on permission")
+def unique_permission_user():
+    if not db.table_exists("permission"):
+        return
+    # آخرین سطح ثبت‌شده هر کاربر معتبر است
+    db.execute_sql("""
+        DELETE FROM permission WHERE id NOT IN (
+            SELECT MAX(id) FROM permission GROUP BY user_id)""")
+    replace_index("permission", "permission_user_id", ["user_id"],
+                  unique=True)
+
+
+@migration(4, "per-chat message ids in message")
+def rebuild_message_table():
+    if not db.table_exists("message") or "chat_id" in columns("message"):
+        return
+    # جدول قدیمی هرگز پر نمی‌شد؛ اگر داده‌ای داشته باشد کنار گذاشته می‌شود
+    # و create_tables جدول جدید را می‌سازد
+    if db.execute_sql("SELECT COUNT(*) FROM message").fetchone()[0]:
+        db.execute_sql("ALTER TABLE message RENAME TO message_legacy")
+        # نام ایندکس‌ها با رفتن به جدول جدید آزاد می‌شوند
+        for index in db.get_indexes("message_legacy"):
+            db.execute_sql(f'DROP INDEX IF EXISTS "{index.name}"')
+    else:
+        db.execute_sql("DROP TABLE message")
+
+
+@migration(5, "full-text search over message")
+def message_search():
+    if not db.table_exists("message"):
+        return
+    if "search_text" not in columns("message"):
+        db.execute_sql("ALTER TABLE message ADD COLUMN search_text TEXT")
+    # پر کردن متن نرمال‌شده پیام‌های قبلی به صورت دسته‌ای
+    last_id = 0
+    while True:
+        rows = db.execute_sql(
+            "SELECT id, text FROM message WHERE id > ? AND text IS NOT NULL "
+            "ORDER BY id LIMIT 1000", (last_id, )).fetchall()
+        if not rows:
+            break
+        db.cursor().executemany(
+            "UPDATE message SET search_text = ? WHERE id = ?",
+            [(PersianTextNormalizer.normalize(text), id_) for id_, text in rows])
+        last_id = rows[-1][0]
+    create_message_search()
+    db.execute_sql("INSERT INTO message_fts(message_fts) VALUES ('rebuild')")
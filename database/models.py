@@ -1,8 +1,25 @@
 from peewee import *
 from config import *
+import config
 import datetime
 
-db = SqliteDatabase('db.sqlite3')
+# تنظیمات SQLite: ژورنال WAL (خواندن هم‌زمان با نوشتن)، synchronous=NORMAL
+# (بدون fsync در هر تراکنش)، کش صفحات ۶۴ مگابایت و mmap ۲۵۶ مگابایت
+DB_PRAGMAS = {
+    # فضای صفحات آزاد با PRAGMA incremental_vacuum برگردانده می‌شود؛ باید قبل
+    # از ساخت اولین جدول (و تغییر ژورنال) تنظیم شود
+    'auto_vacuum': 'incremental',
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -64 * 1024,  # مقدار منفی یعنی کیلوبایت
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,  # میلی‌ثانیه انتظار برای قفل
+    'temp_store': 'memory',
+    **getattr(config, "DB_PRAGMAS", {})
+}
+
+# اتصال هر نخ باز می‌ماند و در کوئری‌های بعدی همان نخ استفاده می‌شود
+db = SqliteDatabase('db.sqlite3', pragmas=DB_PRAGMAS)
 
 
 class BaseModel(Model):
@@ -19,29 +36,120 @@ class User(BaseModel):
 
 
 class Message(BaseModel):
-    id = BigIntegerField(primary_key=True)
-    from_user = ForeignKeyField(User, backref='messages')
+    """تاریخچه پیام‌ها (آیدی پیام در تلگرام فقط در هر چت یکتاست)"""
+    id = BigAutoField()
+    chat_id = BigIntegerField()
+    message_id = BigIntegerField()
+    from_user = ForeignKeyField(User, backref='messages', null=True)
     text = TextField(null=True)
-    date = DateTimeField(default=datetime.datetime.now)
+    date = DateTimeField(default=datetime.datetime.now, index=True)
     is_bot = BooleanField(default=False)
-    reply_to = ForeignKeyField('self', null=True)
+    reply_to_message_id = BigIntegerField(null=True)
+    # متن نرمال‌شده برای جستجوی تمام‌متن (PersianTextNormalizer)
+    search_text = TextField(null=True)
+
+    class Meta:
+        indexes = ((('chat_id', 'message_id'), True),)
 
 
 class Permission(BaseModel):
-    user = ForeignKeyField(User, backref='permissions')
+    user = ForeignKeyField(User, backref='permissions', unique=True)
     status = IntegerField(default=0)  # 0=عادی, 1=ویژه, 2=ادمین, 3=مالک
 
 
 class GeminiUsage(BaseModel):
-    user = ForeignKeyField(User, on_delete="CASCADE")
+    # ایندکس یکتای (user, date) جستجو بر اساس کاربر را هم پوشش می‌دهد
+    user = ForeignKeyField(User, on_delete="CASCADE", index=False)
     date = DateField(default=datetime.date.today)
     count = IntegerField(default=0)
 
+    class Meta:
+        indexes = ((('user', 'date'), True),)
+
+
+class GeminiUsageMonthly(BaseModel):
+    """مجموع ماهانه استفاده از Gemini (سطرهای روزانه قدیمی در آن ادغام می‌شوند)"""
+    user = ForeignKeyField(User, on_delete="CASCADE", index=False)
+    month = DateField()  # روز اول ماه
+    count = IntegerField(default=0)
+
+    class Meta:
+        indexes = ((('user', 'month'), True),)
+
 
 class BotStatus(BaseModel):
     is_active = BooleanField(default=True)
+    # با هر تغییر وضعیت افزایش می‌یابد تا پروسه‌های دیگر تغییر را تشخیص دهند
+    version = IntegerField(default=0)
+
+
+class SchemaVersion(BaseModel):
+    """نسخه‌های اعمال‌شده مهاجرت‌های دیتابیس (database/migrations.py)"""
+    version = IntegerField(primary_key=True)
+    description = CharField()
+    applied_at = DateTimeField(default=datetime.datetime.now)
+
+
+class CacheEntry(BaseModel):
+    """لایه ماندگار کش‌ها (کلید یکتا در هر فضای نام)"""
+    namespace = CharField()
+    key = CharField()
+    value = TextField()
+    expires_at = DateTimeField(index=True)
+
+    class Meta:
+        indexes = ((('namespace', 'key'), True),)
+
+
+class ApiUsage(BaseModel):
+    """مصرف روزانه سرویس‌های خارجی (Google و Gemini) برای کل ربات"""
+    api = CharField()
+    date = DateField(default=datetime.date.today)
+    calls = IntegerField(default=0)
+    tokens = IntegerField(default=0)
+
+    class Meta:
+        indexes = ((('api', 'date'), True),)
+
+
+def create_message_search():
+    """
+    ایندکس FTS5 روی Message.search_text که با تریگرها همگام می‌ماند
+
+    جدول FTS فقط ایندکس را نگه می‌دارد (external content) و متن از جدول
+    message خوانده می‌شود.
+    """
+    db.execute_sql("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+            search_text, content='message', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2')""")
+    db.execute_sql("""
+        CREATE TRIGGER IF NOT EXISTS message_fts_insert AFTER INSERT ON message
+        WHEN new.search_text IS NOT NULL BEGIN
+            INSERT INTO message_fts(rowid, search_text)
+            VALUES (new.id, new.search_text);
+        END""")
+    db.execute_sql("""
+        CREATE TRIGGER IF NOT EXISTS message_fts_delete AFTER DELETE ON message
+        WHEN old.search_text IS NOT NULL BEGIN
+            INSERT INTO message_fts(message_fts, rowid, search_text)
+            VALUES ('delete', old.id, old.search_text);
+        END""")
+    db.execute_sql("""
+        CREATE TRIGGER IF NOT EXISTS message_fts_update
+        AFTER UPDATE OF search_text ON message BEGIN
+            INSERT INTO message_fts(message_fts, rowid, search_text)
+            SELECT 'delete', old.id, old.search_text
+            WHERE old.search_text IS NOT NULL;
+            INSERT INTO message_fts(rowid, search_text)
+            SELECT new.id, new.search_text WHERE new.search_text IS NOT NULL;
+        END""")
 
 
 def create_tables():
-    with db:
-        db.create_tables([User, Message, Permission, BotStatus, GeminiUsage])
+    db.connect(reuse_if_open=True)
+    with db.atomic():
+        db.create_tables([User, Message, Permission, BotStatus, GeminiUsage,
+                          CacheEntry, ApiUsage, SchemaVersion,
+                          GeminiUsageMonthly])
+        create_message_search()
@@ -0,0 +1,164 @@
+# database\retention.py
+import datetime
+import gzip
+import json
+import logging
+import os
+from typing import Optional
+from database.models import db, CacheEntry
+from database.utils import run_db
+from utils.lifecycle import run_periodically
+import config
+
+logger = logging.getLogger(__name__)
+
+# سطرهای روزانه GeminiUsage قدیمی‌تر از این تعداد روز در مجموع ماهانه ادغام می‌شوند
+GEMINI_USAGE_RETENTION_DAYS = getattr(config, "GEMINI_USAGE_RETENTION_DAYS",
+                                      90)
+# پیام‌های قدیمی‌تر از این تعداد روز از دیتابیس خارج می‌شوند (None یعنی نگهداری دائمی)
+HISTORY_RETENTION_DAYS = getattr(config, "HISTORY_RETENTION_DAYS", 180)
+# پوشه آرشیو فشرده پیام‌های حذف‌شده (None یعنی حذف بدون آرشیو)
+HISTORY_ARCHIVE_DIR = getattr(config, "HISTORY_ARCHIVE_DIR", "archive")
+# ساعت‌های کم‌ترافیک (ساعت محلی، [شروع، پایان)) برای اجرای روزانه نگهداری
+RETENTION_QUIET_HOURS = getattr(config, "RETENTION_QUIET_HOURS", (3, 6))
+
+ARCHIVE_BATCH_SIZE = 5000
+
+# گزارش آخرین اجرا برای نمایش به مالک
+last_report: Optional[dict] = None
+_last_run: Optional[datetime.date] = None
+
+
+def database_size() -> int:
+    """اندازه فایل دیتابیس بر اساس صفحات (بایت)"""
+    page_size = db.execute_sql("PRAGMA page_size").fetchone()[0]
+    page_count = db.execute_sql("PRAGMA page_count").fetchone()[0]
+    return page_size * page_count
+
+
+def rollup_gemini_usage(days: int) -> int:
+    """ادغام سطرهای روزانه قدیمی در مجموع ماهانه؛ تعداد سطرهای حذف‌شده"""
+    cutoff = (datetime.date.today() - datetime.timedelta(days=days)).isoformat()
+    with db.atomic():
+        db.execute_sql(
+            """
+            INSERT INTO geminiusagemonthly (user_id, month, count)
+            SELECT user_id, date(date, 'start of month'), SUM(count)
+            FROM geminiusage WHERE date < ?
+            GROUP BY user_id, date(date, 'start of month')
+            ON CONFLICT (user_id, month)
+            DO UPDATE SET count = count + excluded.count""", (cutoff, ))
+        return db.execute_sql("DELETE FROM geminiusage WHERE date < ?",
+                              (cutoff, )).rowcount
+
+
+def archive_messages(days: int, archive_dir: Optional[str]) -> tuple[int, str]:
+    """
+    انتقال پیام‌های قدیمی به فایل فشرده JSON Lines و حذف آن‌ها
+
+    هر دسته ابتدا در فایل نوشته و سپس حذف می‌شود؛ تریگرها ایندکس FTS را
+    به‌روز می‌کنند.
+
+    Returns:
+        (تعداد پیام‌ها, مسیر فایل آرشیو یا رشته خالی)
+    """
+    cutoff = str(
+        datetime.datetime.combine(
+            datetime.date.today() - datetime.timedelta(days=days),
+            datetime.time.min))
+    path = ""
+    archive = None
+    if archive_dir:
+        os.makedirs(archive_dir, exist_ok=True)
+        path = os.path.join(
+            archive_dir,
+            f"messages-{datetime.datetime.now():%Y%m%d-%H%M%S}.jsonl.gz")
+
+    total = 0
+    try:
+        while True:
+            cursor = db.execute_sql(
+                "SELECT id, chat_id, message_id, from_user_id, text, date, "
+                "is_bot, reply_to_message_id FROM message WHERE date < ? "
+                "ORDER BY id LIMIT ?", (cutoff, ARCHIVE_BATCH_SIZE))
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            if path:
+                if archive is None:
+                    archive = gzip.open(path, "at", encoding="utf-8")
+                for row in rows:
+                    archive.write(
+                        json.dumps(dict(zip(columns, row)),
+                                   ensure_ascii=False) + "\n")
+                archive.flush()
+            with db.atomic():
+                db.execute_sql("DELETE FROM message WHERE id <= ? AND date < ?",
+                               (rows[-1][0], cutoff))
+            total += len(rows)
+    finally:
+        if archive is not None:
+            archive.close()
+    return total, path if total else ""
+
+
+def reclaim_space() -> None:
+    """بازگرداندن صفحات آزاد به سیستم فایل"""
+    db.execute_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    if db.execute_sql("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        # دیتابیس‌های قدیمی یک بار با VACUUM کامل به حالت incremental می‌روند
+        db.execute_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        db.execute_sql("VACUUM")
+    else:
+        db.execute_sql("PRAGMA incremental_vacuum")
+    db.execute_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def run_retention() -> dict:
+    """اجرای همه کارهای نگهداری و بازگرداندن گزارش"""
+    size_before = database_size()
+    report = {'started_at': datetime.datetime.now().isoformat(timespec="seconds")}
+
+    report['usage_rows'] = rollup_gemini_usage(GEMINI_USAGE_RETENTION_DAYS)
+    report['messages'], report['archive'] = 0, ""
+    if HISTORY_RETENTION_DAYS:
+        report['messages'], report['archive'] = archive_messages(
+            HISTORY_RETENTION_DAYS, HISTORY_ARCHIVE_DIR)
+    report['cache_entries'] = CacheEntry.delete().where(
+        CacheEntry.expires_at <= datetime.datetime.now()).execute()
+    reclaim_space()
+
+    report['size'] = database_size()
+    report['reclaimed'] = max(0, size_before - report['size'])
+    return report
+
+
+async def run_retention_async() -> dict:
+    global last_report
+    last_report = await run_db(run_retention)
+    logger.info(f"Retention finished: {last_report}")
+    return last_report
+
+
+def in_quiet_hours(hour: int) -> bool:
+    """آیا ساعت داده‌شده داخل بازه کم‌ترافیک است (بازه می‌تواند از نیمه‌شب بگذرد)"""
+    start, end = RETENTION_QUIET_HOURS
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+async def retention_tick() -> None:
+    """اجرای روزانه نگهداری در اولین بررسی داخل ساعت‌های کم‌ترافیک"""
+    global _last_run
+    now = datetime.datetime.now()
+    # روز شروع بازه ملاک است تا بازه‌ای مثل (23, 2) دو بار اجرا نشود
+    window_day = (now - datetime.timedelta(hours=RETENTION_QUIET_HOURS[0])).date()
+    if _last_run == window_day or not in_quiet_hours(now.hour):
+        return
+    _last_run = window_day
+    await run_retention_async()
+
+
+run_periodically(15 * 60, retention_tick)
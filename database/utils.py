@@ -1,8 +1,64 @@
 # database\utils.py
+import asyncio
 import datetime
-from database.models import User, Permission, GeminiUsage
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import LRUCache, TTLCache
+from database.models import User, Permission, GeminiUsage, BotStatus, db
+from peewee import chunked
+from utils.lifecycle import on_shutdown, on_startup, run_periodically
+import config
 from config import OWNER_ID
-from typing import Optional
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# فاصله اجرای نگهداری دیتابیس (checkpoint فایل WAL و optimize)، ثانیه
+DB_MAINTENANCE_INTERVAL = getattr(config, "DB_MAINTENANCE_INTERVAL", 3600)
+# تعداد نخ‌های دیتابیس؛ SQLite در هر لحظه فقط یک نویسنده دارد پس یک نخ کافی است
+DB_THREADS = getattr(config, "DB_THREADS", 1)
+
+# فاصله بررسی تغییر وضعیت ربات توسط پروسه‌های دیگر (None یعنی غیرفعال)
+BOT_STATUS_REFRESH_INTERVAL = getattr(config, "BOT_STATUS_REFRESH_INTERVAL",
+                                      30)
+# سقف درخواست روزانه هر کاربر از Gemini و فاصله ذخیره شمارنده‌ها (ثانیه)
+GEMINI_USER_DAILY_LIMIT = getattr(config, "GEMINI_USER_DAILY_LIMIT", 30)
+GEMINI_QUOTA_FLUSH_INTERVAL = getattr(config, "GEMINI_QUOTA_FLUSH_INTERVAL",
+                                      10)
+# کش سطح دسترسی کاربران (TTL برابر None یعنی بدون انقضا)
+PERMISSION_CACHE_SIZE = getattr(config, "PERMISSION_CACHE_SIZE", 10000)
+PERMISSION_CACHE_TTL = getattr(config, "PERMISSION_CACHE_TTL", 600)
+
+# همه کوئری‌ها در این نخ(ها) و به ترتیب صف اجرا می‌شوند تا حلقه رویداد مسدود نشود
+_db_executor = ThreadPoolExecutor(max_workers=DB_THREADS,
+                                  thread_name_prefix="db")
+
+# تغییرات سطح دسترسی از طریق set_user_permission مستقیماً در کش نوشته می‌شوند
+_permission_cache = (TTLCache(PERMISSION_CACHE_SIZE, PERMISSION_CACHE_TTL)
+                     if PERMISSION_CACHE_TTL else
+                     LRUCache(PERMISSION_CACHE_SIZE))
+_permission_lock = threading.Lock()
+
+
+async def run_db(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """اجرای یک تابع همگام دیتابیس در نخ دیتابیس و انتظار برای نتیجه"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _db_executor, functools.partial(func, *args, **kwargs))
+
+
+def awaitable(func: Callable[..., T]) -> Callable[..., Awaitable[T]]:
+    """ساخت نسخه قابل انتظار (async) از یک تابع همگام دیتابیس"""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+
+    return wrapper
 
 
 def get_or_create_user(user_id: int, first_name: str, last_name: Optional[str],
@@ -20,10 +76,35 @@ def get_user_permission(user_id: int) -> int:
     """دریافت وضعیت سطح دسترسی کاربر"""
     if user_id == OWNER_ID:
         return 3  # مالک
-    try:
-        return Permission.get(Permission.user_id == user_id).status
-    except Permission.DoesNotExist:
-        return 0  # کاربر عادی
+    status = cached_permission(user_id)
+    if status is None:
+        status = load_user_permission(user_id)
+    return status
+
+
+def cached_permission(user_id: int) -> Optional[int]:
+    """سطح دسترسی کاربر از کش (None اگر در کش نباشد)"""
+    with _permission_lock:
+        return _permission_cache.get(user_id)
+
+
+def load_user_permission(user_id: int) -> int:
+    """خواندن سطح دسترسی از دیتابیس و ذخیره در کش"""
+    permission = get_permission_by_id(user_id)
+    status = permission.status if permission else 0  # کاربر عادی
+    with _permission_lock:
+        _permission_cache[user_id] = status
+    return status
+
+
+async def get_user_permission_async(user_id: int) -> int:
+    """نسخه async؛ در صورت وجود در کش بدون رفتن به نخ دیتابیس پاسخ می‌دهد"""
+    if user_id == OWNER_ID:
+        return 3
+    status = cached_permission(user_id)
+    if status is None:
+        status = await run_db(load_user_permission, user_id)
+    return status
 
 
 def get_permission_by_id(user_id: int):
@@ -34,30 +115,171 @@ def get_permission_by_id(user_id: int):
         pass
 
 
-def can_use_gemini(user_id: int) -> bool:
-    """بررسی سهمیه استفاده از Gemini"""
-    if user_id == OWNER_ID:
-        return True
+def set_user_permission(user_id: int, status: int) -> None:
+    """تعیین سطح دسترسی کاربر"""
+    permission, created = Permission.get_or_create(
+        user_id=user_id, defaults={'status': status})
+    if not created:
+        permission.status = status
+        permission.save()
+    with _permission_lock:
+        _permission_cache[user_id] = status
 
-    today = datetime.date.today()
-    try:
-        usage = GeminiUsage.get((GeminiUsage.user_id == user_id)
-                                & (GeminiUsage.date == today))
-        return usage.count < 30
-    except GeminiUsage.DoesNotExist:
+
+class BotState:
+    """وضعیت روشن/خاموش ربات در حافظه (بررسی آن در هر دستور بدون کوئری است)"""
+    __slots__ = ("is_active", "version")
+
+    def __init__(self):
+        self.is_active = True
+        self.version = 0
+
+
+bot_state = BotState()
+
+
+def load_bot_status() -> None:
+    """خواندن وضعیت ربات از دیتابیس به حافظه"""
+    status = BotStatus.get_or_create(id=1)[0]
+    bot_state.is_active = status.is_active
+    bot_state.version = status.version
+
+
+def set_bot_active(is_active: bool) -> None:
+    """روشن یا خاموش کردن ربات"""
+    BotStatus.get_or_create(id=1)
+    BotStatus.update(is_active=is_active,
+                     version=BotStatus.version + 1).where(
+                         BotStatus.id == 1).execute()
+    load_bot_status()
+
+
+def refresh_bot_status() -> None:
+    """بارگذاری مجدد وضعیت فقط اگر پروسه دیگری آن را تغییر داده باشد"""
+    version = BotStatus.select(
+        BotStatus.version).where(BotStatus.id == 1).scalar()
+    if version is not None and version != bot_state.version:
+        load_bot_status()
+
+
+class GeminiQuota:
+    """
+    شمارنده سهمیه روزانه Gemini در حافظه با ذخیره‌سازی تأخیری
+
+    بررسی و افزایش شمارنده بدون وقفه (await) بین آن دو و در حلقه رویداد
+    انجام می‌شود پس درخواست‌های هم‌زمان نمی‌توانند از سقف عبور کنند.
+    شمارنده‌های تغییرکرده به صورت دسته‌ای در GeminiUsage نوشته می‌شوند.
+    """
+
+    def __init__(self, limit: int = GEMINI_USER_DAILY_LIMIT):
+        self.limit = limit
+        self._day = datetime.date.today()
+        self._counts: dict[int, int] = {}
+        # (روز, کاربر) -> مقدار نهایی که هنوز در دیتابیس نوشته نشده
+        self._dirty: dict[tuple[datetime.date, int], int] = {}
+
+    async def count(self, user_id: int) -> int:
+        """تعداد استفاده امروز کاربر"""
+        self._rollover()
+        if user_id not in self._counts:
+            loaded = await run_db(self._load, user_id, self._day)
+            self._rollover()
+            self._counts.setdefault(user_id, loaded)
+        return self._counts[user_id]
+
+    async def try_use(self, user_id: int) -> bool:
+        """بررسی و کسر یک واحد از سهمیه امروز به صورت اتمیک"""
+        if user_id == OWNER_ID:
+            return True
+        count = await self.count(user_id)
+        if count >= self.limit:
+            return False
+        self._set(user_id, count + 1)
         return True
 
+    async def refund(self, user_id: int) -> None:
+        """بازگرداندن یک واحد از سهمیه امروز (برای درخواست‌های ناموفق)"""
+        if user_id == OWNER_ID:
+            return
+        count = await self.count(user_id)
+        if count > 0:
+            self._set(user_id, count - 1)
 
-def increment_gemini_usage(user_id: int):
-    """افزایش تعداد استفاده از Gemini"""
-    if user_id == OWNER_ID:
-        return
+    async def flush(self) -> None:
+        """نوشتن دسته‌ای شمارنده‌های تغییرکرده در دیتابیس"""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        try:
+            await run_db(self._store, dirty)
+        except Exception as e:
+            logger.error(f"Gemini quota flush failed: {str(e)}")
+            # مقادیر جدیدتری که در این فاصله ثبت شده‌اند حفظ می‌شوند
+            self._dirty = {**dirty, **self._dirty}
 
-    today = datetime.date.today()
-    try:
-        usage = GeminiUsage.get((GeminiUsage.user_id == user_id)
-                                & (GeminiUsage.date == today))
-        usage.count += 1
-        usage.save()
-    except GeminiUsage.DoesNotExist:
-        GeminiUsage.create(user_id=user_id, date=today, count=1)
+    def _set(self, user_id: int, count: int) -> None:
+        self._counts[user_id] = count
+        self._dirty[(self._day, user_id)] = count
+
+    def _rollover(self) -> None:
+        # با شروع روز جدید فقط شمارنده‌های حافظه خالی می‌شوند؛ سطرهای روز قبل
+        # دست نمی‌خورند و مقادیر ذخیره‌نشده آن روز همچنان در _dirty هستند
+        today = datetime.date.today()
+        if today != self._day:
+            self._day = today
+            self._counts.clear()
+
+    @staticmethod
+    def _load(user_id: int, day: datetime.date) -> int:
+        usage = GeminiUsage.get_or_none((GeminiUsage.user_id == user_id)
+                                        & (GeminiUsage.date == day))
+        return usage.count if usage else 0
+
+    @staticmethod
+    def _store(dirty: dict[tuple[datetime.date, int], int]) -> None:
+        rows = [{
+            'user': user_id,
+            'date': day,
+            'count': count
+        } for (day, user_id), count in dirty.items()]
+        with db.atomic():
+            for batch in chunked(rows, 300):
+                GeminiUsage.insert_many(batch).on_conflict(
+                    conflict_target=[GeminiUsage.user, GeminiUsage.date],
+                    preserve=[GeminiUsage.count]).execute()
+
+
+gemini_quota = GeminiQuota()
+
+
+def maintain_database() -> None:
+    """انتقال فایل WAL به دیتابیس اصلی و به‌روزرسانی آمار کوئری‌ها"""
+    db.execute_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    db.execute_sql("PRAGMA optimize")
+
+
+async def maintain_database_async() -> None:
+    await run_db(maintain_database)
+
+
+async def load_bot_status_async() -> None:
+    await run_db(load_bot_status)
+
+
+async def refresh_bot_status_async() -> None:
+    await run_db(refresh_bot_status)
+
+
+run_periodically(DB_MAINTENANCE_INTERVAL, maintain_database_async)
+on_shutdown(maintain_database_async)
+on_startup(load_bot_status_async)
+run_periodically(GEMINI_QUOTA_FLUSH_INTERVAL, gemini_quota.flush)
+on_shutdown(gemini_quota.flush)
+if BOT_STATUS_REFRESH_INTERVAL:
+    run_periodically(BOT_STATUS_REFRESH_INTERVAL, refresh_bot_status_async)
+
+
+# نسخه‌های async برای استفاده در هندلرها
+get_or_create_user_async = awaitable(get_or_create_user)
+set_user_permission_async = awaitable(set_user_permission)
+set_bot_active_async = awaitable(set_bot_active)
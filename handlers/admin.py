@@ -1,28 +1,33 @@
 # handlers\admin.py
-from pyrogram import filters
+import logging
+from pyrogram import Client, filters
 from pyrogram.types import Message
-from pyrogram import Client
 from pyrogram.handlers import MessageHandler
 from config import OWNER_ID
-from myapp import logger
-from database.models import Permission, BotStatus
+from database import retention
+from database.utils import set_bot_active_async, set_user_permission_async
 from utils.decorators import require_permission, register_command
+from utils.cache import cache_registry
+from utils.quota import api_quota
+from handlers.gemini import gemini_bot, gemini_scheduler, GEMINI_RPM
 
+# تنظیمات لاگ‌گیری
+logger = logging.getLogger(__name__)
 
 
 @register_command("بات خاموش", "")
 @require_permission(level=3)
 async def bot_off_handler(client: Client, message: Message):
     """خاموش کردن ربات"""
-    BotStatus.update(is_active=False).where(BotStatus.id == 1).execute()
+    await set_bot_active_async(False)
     await message.reply("🔴 ربات خاموش شد!")
 
 
-@register_command("بات روشن", "")
+@register_command("بات روشن", "", critical=True)
 @require_permission(level=3)
 async def bot_on_handler(client: Client, message: Message):
     """روشن کردن ربات"""
-    BotStatus.update(is_active=True).where(BotStatus.id == 1).execute()
+    await set_bot_active_async(True)
     await message.reply("🟢 ربات روشن شد!")
 
 
@@ -38,14 +43,7 @@ async def promote_admin_handler(client: Client, message: Message):
         if target.id == OWNER_ID:
             return await message.reply("⛔ این کاربر مالک ربات است و نمی‌توان تغییر داد")
 
-        permission, created = Permission.get_or_create(
-            user_id=target.id,
-            defaults={'status': 2}
-        )
-
-        if not created:
-            permission.status = 2
-            permission.save()
+        await set_user_permission_async(target.id, 2)
 
         await message.reply(f"✅ کاربر {target.first_name} ({target.id}) با موفقیت ادمین شد!")
     except Exception as e:
@@ -66,14 +64,7 @@ async def promote_staff_handler(client: Client, message: Message):
         if target.id == OWNER_ID:
             return await message.reply("⛔ این کاربر مالک ربات است و نمی‌توان تغییر داد")
 
-        permission, created = Permission.get_or_create(
-            user_id=target.id,
-            defaults={'status': 1}
-        )
-
-        if not created:
-            permission.status = 1
-            permission.save()
+        await set_user_permission_async(target.id, 1)
 
         await message.reply(f"✅ کاربر {target.first_name} ({target.id}) با موفقیت کاربر ویژه شد!")
     except Exception as e:
@@ -93,14 +84,7 @@ async def demote_user_handler(client: Client, message: Message):
         if target.id == OWNER_ID:
             return await message.reply("⛔ این کاربر مالک ربات است و نمی‌توان تغییر داد")
 
-        permission, created = Permission.get_or_create(
-            user_id=target.id,
-            defaults={'status': 0}
-        )
-
-        if not created:
-            permission.status = 0
-            permission.save()
+        await set_user_permission_async(target.id, 0)
 
         await message.reply(f"✅ کاربر {target.first_name} ({target.id}) با موفقیت به کاربر عادی تبدیل شد!")
     except Exception as e:
@@ -108,6 +92,88 @@ async def demote_user_handler(client: Client, message: Message):
         await message.reply("⚠️ خطا در تبدیل کاربر به عادی")
 
 
+@register_command("آمار کش", "")
+@require_permission(level=2)
+async def cache_stats_handler(client: Client, message: Message):
+    """نمایش آمار کش‌ها (اصابت، عدم اصابت و حذف)"""
+    lines = ["📦 آمار کش‌ها:", ""]
+    for cache in cache_registry:
+        info = cache.info()
+        lines.append(
+            f"▫️ {info['namespace']}: {info['size']}/{info['maxsize']} | "
+            f"hit {info['hits']} | miss {info['misses']} | "
+            f"evict {info['evictions']}")
+    await message.reply("\n".join(lines))
+
+
+@register_command("آمار جمنای", "")
+@require_permission(level=2)
+async def gemini_stats_handler(client: Client, message: Message):
+    """نمایش آمار فراخوانی‌های Gemini"""
+    flight = gemini_bot.inflight.stats()
+    queue = gemini_scheduler.stats()
+    health = gemini_bot.health()
+    breaker_state = {
+        "closed": "🟢 بسته (عادی)",
+        "open": f"🔴 باز (تلاش مجدد تا {health['retry_in']} ثانیه دیگر)",
+        "half_open": "🟡 نیمه‌باز (در حال آزمایش)"
+    }[health['state']]
+    await message.reply("\n".join([
+        "🔮 آمار Gemini:", "",
+        f"▫️ قطع‌کننده مدار: {breaker_state}",
+        f"▫️ خطاهای متوالی: {health['failures']}",
+        f"▫️ تکرارهای انجام‌شده: {health['retries']}",
+        f"▫️ تأخیر صدک ۹۵: {health['p95'] if health['p95'] is not None else '-'} ثانیه",
+        f"▫️ فراخوانی‌های واقعی: {flight['calls']}",
+        f"▫️ درخواست‌های ادغام‌شده: {flight['coalesced']}",
+        f"▫️ در حال اجرا: {flight['in_flight']}",
+        f"▫️ در صف: {queue['pending']}",
+        f"▫️ انجام‌شده: {queue['completed']}",
+        f"▫️ رد شده (صف پر): {queue['rejected']}",
+        f"▫️ درخواست‌های API در دقیقه اخیر: {health['requests_last_minute']}/{GEMINI_RPM}"
+    ]))
+
+
+@register_command("مصرف سرویس", "")
+@require_permission(level=3)
+async def api_usage_handler(client: Client, message: Message):
+    """نمایش مصرف امروز سرویس‌های Google و Gemini نسبت به بودجه روزانه"""
+    states = {
+        api_quota.OK: "🟢 عادی",
+        api_quota.SOFT: "🟡 نزدیک به سقف (فقط کاربران پراولویت)",
+        api_quota.HARD: "🔴 تمام شده (فقط کش)"
+    }
+    lines = ["📈 مصرف امروز سرویس‌ها:"]
+    for usage in api_quota.report():
+        lines += [
+            "", f"🔹 {usage['api']}: {states[usage['state']]}",
+            f"▫️ فراخوانی: {usage['calls']}/{usage['calls_limit'] or '∞'}",
+            f"▫️ توکن: {usage['tokens']}/{usage['tokens_limit'] or '∞'}",
+            f"▫️ رد شده: {usage['rejected']}"
+        ]
+    await message.reply("\n".join(lines))
+
+
+@register_command("نگهداری دیتابیس", "")
+@require_permission(level=3)
+async def retention_handler(client: Client, message: Message):
+    """
+    اجرای فوری کارهای نگهداری دیتابیس (ادغام مصرف قدیمی، آرشیو پیام‌ها،
+    حذف کش منقضی و VACUUM) و نمایش گزارش
+    """
+    progress = await message.reply("🧹 در حال نگهداری دیتابیس...")
+    report = await retention.run_retention_async()
+    await progress.edit_text("\n".join([
+        "🧹 گزارش نگهداری دیتابیس:", "",
+        f"▫️ سطرهای مصرف ادغام‌شده: {report['usage_rows']}",
+        f"▫️ پیام‌های آرشیوشده: {report['messages']}"
+        + (f" ({report['archive']})" if report['archive'] else ""),
+        f"▫️ کش‌های منقضی حذف‌شده: {report['cache_entries']}",
+        f"▫️ فضای آزادشده: {report['reclaimed'] / 1024:.1f} KB",
+        f"▫️ حجم فعلی: {report['size'] / 1024 / 1024:.1f} MB"
+    ]))
+
+
 async def get_target_user(client: Client, message: Message):
     """دریافت کاربر هدف از ریپلای یا آیدی/یوزرنیم"""
     # اگر ریپلای شده باشد
@@ -144,7 +210,11 @@ def register_admin_handlers(app: Client):
         (bot_on_handler, filters.command("بات روشن", "")),
         (promote_admin_handler, filters.command("کاربر ادمین", "")),
         (promote_staff_handler, filters.command("کاربر ویژه", "")),
-        (demote_user_handler, filters.command("کاربر عادی", ""))
+        (demote_user_handler, filters.command("کاربر عادی", "")),
+        (cache_stats_handler, filters.command("آمار کش", "")),
+        (gemini_stats_handler, filters.command("آمار جمنای", "")),
+        (api_usage_handler, filters.command("مصرف سرویس", "")),
+        (retention_handler, filters.command("نگهداری دیتابیس", ""))
     ]
 
     for handler, filter in handlers:
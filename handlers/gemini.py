@@ -2,43 +2,439 @@ from pyrogram import filters
 from pyrogram.types import Message
 from pyrogram import Client
 from google import genai
-from typing import Optional
+from typing import AsyncIterator, Awaitable, Callable, Optional
+import config
 from config import GEMINI_API_KEY, GEMINI_MODEL
-from database.utils import can_use_gemini, increment_gemini_usage
-from utils.helpers import format_response
+from database.utils import gemini_quota, get_user_permission_async
+from utils.helpers import format_response, split_on_boundaries
+from handlers.google import google_searcher, format_search_results
+from utils.streaming import StreamingMessage, StreamInterrupted
+from utils.cache import TieredCache
+from utils.concurrency import SingleFlight
+from utils.scheduler import PriorityScheduler, SchedulerBusy
+from utils.resilience import (CircuitBreaker, CircuitOpenError, LatencyTracker,
+                              RetryPolicy, hedged, is_retryable)
+from utils.converters import PersianTextNormalizer
+from utils.quota import api_quota, request_user
 from utils.decorators import register_command, rate_limit, require_permission
+from utils.ratelimit import get_limiter
 import logging
 from pyrogram.handlers import MessageHandler
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from pyrogram.enums import ParseMode
 import re
+import asyncio
+import hashlib
+import json
+import time
 
 # تنظیمات لاگ
 logger = logging.getLogger(__name__)
 
+# حداکثر درخواست همزمان به Gemini و مهلت هر درخواست (ثانیه)
+GEMINI_MAX_CONCURRENCY = getattr(config, "GEMINI_MAX_CONCURRENCY", 8)
+GEMINI_TIMEOUT = getattr(config, "GEMINI_TIMEOUT", 60)
+# ارسال تدریجی پاسخ‌ها هنگام تولید
+GEMINI_STREAMING = getattr(config, "GEMINI_STREAMING", True)
+# کش پاسخ‌ها و دستوراتی که از آن استفاده می‌کنند
+GEMINI_CACHE_COMMANDS = getattr(config, "GEMINI_CACHE_COMMANDS",
+                                ("gemini", "translate", "reply", "inline",
+                                 "ask"))
+GEMINI_CACHE_SIZE = getattr(config, "GEMINI_CACHE_SIZE", 1000)
+GEMINI_CACHE_TTL = getattr(config, "GEMINI_CACHE_TTL", 24 * 3600)
+# سهمیه مشترک همه دستورات Gemini برای هر کاربر: (تعداد، بازه به ثانیه)
+GEMINI_RATE_LIMIT = getattr(config, "GEMINI_RATE_LIMIT", (5, 60))
+# بودجه درخواست در دقیقه (مطابق سهمیه API) و حداکثر عمق صف
+GEMINI_RPM = getattr(config, "GEMINI_RPM", 60)
+GEMINI_QUEUE_LIMIT = getattr(config, "GEMINI_QUEUE_LIMIT", 50)
+# تکرار خطاهای موقت، قطع‌کننده مدار و درخواست پشتیبان (hedging)
+GEMINI_RETRY_ATTEMPTS = getattr(config, "GEMINI_RETRY_ATTEMPTS", 3)
+GEMINI_BREAKER_THRESHOLD = getattr(config, "GEMINI_BREAKER_THRESHOLD", 5)
+GEMINI_BREAKER_RESET = getattr(config, "GEMINI_BREAKER_RESET", 30)
+GEMINI_HEDGING = getattr(config, "GEMINI_HEDGING", False)
+# تعداد نتایج جستجو که به پاسخ مستند (دستور «بپرس») داده می‌شود
+GROUNDED_SOURCES = getattr(config, "GROUNDED_SOURCES", 5)
+TRANSLATION_CACHE_TTL = getattr(config, "TRANSLATION_CACHE_TTL", 7 * 24 * 3600)
+# متن‌های طولانی‌تر از این اندازه به صورت تکه‌تکه و موازی ترجمه می‌شوند
+TRANSLATION_CHUNK_SIZE = getattr(config, "TRANSLATION_CHUNK_SIZE", 1500)
+# حداکثر تکه‌های هم‌زمان یک ترجمه تا سهم بقیه کاربران از همزمانی حفظ شود
+TRANSLATION_PARALLEL_CHUNKS = getattr(config, "TRANSLATION_PARALLEL_CHUNKS", 2)
+
 
 class GeminiBot:
 
-    def __init__(self):
+    def __init__(self,
+                 max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+                 timeout: float = GEMINI_TIMEOUT):
         self.client = genai.Client(api_key=GEMINI_API_KEY)
         self.model = GEMINI_MODEL
+        self.timeout = timeout
+        # محدودیت سراسری تعداد درخواست‌های در حال اجرا
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.cache = TieredCache("gemini_responses",
+                                 maxsize=GEMINI_CACHE_SIZE,
+                                 ttl=GEMINI_CACHE_TTL,
+                                 persistent=True)
+        # ادغام درخواست‌های هم‌زمان یکسان
+        self.inflight = SingleFlight()
+        self.retry_policy = RetryPolicy(attempts=GEMINI_RETRY_ATTEMPTS)
+        self.breaker = CircuitBreaker(
+            failure_threshold=GEMINI_BREAKER_THRESHOLD,
+            reset_timeout=GEMINI_BREAKER_RESET)
+        self.latency = LatencyTracker()
+        # بودجه سراسری درخواست در دقیقه؛ هر فراخوانی واقعی (تکرار و پشتیبان هم) یکی حساب می‌شود
+        self.rpm_limiter = get_limiter("gemini_api", GEMINI_RPM, 60)
+        self.hedging = GEMINI_HEDGING
+        self.retries = 0
+        self.hedge_delay: Optional[float] = None
+
+    def cache_key(self, prompt: str, instruction: Optional[str] = None) -> str:
+        """کلید کش: هش متن نرمال‌شده به همراه نام مدل و دستورالعمل"""
+        raw = "\x1f".join((self.model, instruction or "",
+                           PersianTextNormalizer.normalize(prompt)))
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    async def get_cached(self,
+                         prompt: str,
+                         instruction: Optional[str] = None) -> Optional[str]:
+        """پاسخ ذخیره‌شده برای همین سوال (در صورت وجود)"""
+        return await self.cache.get(self.cache_key(prompt, instruction))
+
+    @staticmethod
+    def build_prompt(prompt: str, instruction: Optional[str] = None) -> str:
+        return f"{instruction}:\n{prompt}" if instruction else prompt
+
+    async def generate_response(
+            self,
+            prompt: str,
+            instruction: Optional[str] = None,
+            cache: bool = False,
+            generation_config: Optional[dict] = None) -> Optional[str]:
+        """تولید پاسخ از Gemini با مدیریت خطا (بدون مسدود کردن حلقه رویداد)"""
+        key = self.cache_key(prompt, instruction)
+        if cache:
+            cached = await self.cache.get(key)
+            if cached:
+                return cached
+
+        # درخواست‌های هم‌زمان با همین سوال منتظر یک فراخوانی مشترک می‌مانند
+        return await self.inflight.do(
+            key, lambda: self._generate(prompt, instruction, key, cache,
+                                        generation_config))
+
+    async def stream_response(self,
+                              prompt: str,
+                              cache: bool = False) -> AsyncIterator[str]:
+        """تولید تدریجی پاسخ (تکه به تکه) با همان محدودیت همزمانی و مهلت"""
+        key = self.cache_key(prompt)
+        if cache:
+            cached = await self.cache.get(key)
+            if cached:
+                yield cached
+                return
+
+        async for piece in self.inflight.stream(
+                key, lambda: self._stream(prompt, key, cache)):
+            yield piece
+
+    async def _call_with_retry(self, func: Callable[[], Awaitable]):
+        """
+        اجرای فراخوانی با قطع‌کننده مدار و تکرار خطاهای موقت
+
+        Raises:
+            CircuitOpenError: اگر مدار باز باشد
+            Exception: آخرین خطا پس از اتمام تلاش‌ها یا خطای دائمی
+        """
+        for attempt in range(self.retry_policy.attempts):
+            probe = self.breaker.state == CircuitBreaker.HALF_OPEN
+            if not self.breaker.allow():
+                raise CircuitOpenError("Gemini circuit is open")
+            try:
+                result = await func()
+            except Exception as e:
+                if not is_retryable(e):
+                    # خطای دائمی (400، فیلتر ایمنی) یعنی سرویس در دسترس است
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt + 1 >= self.retry_policy.attempts:
+                    raise
+                delay = self.retry_policy.delay(attempt)
+                self.retries += 1
+                logger.warning(f"Gemini transient error ({str(e)}), "
+                               f"retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                # در صورت لغو هم جایگاه درخواست آزمایشی نیمه‌باز آزاد شود
+                if probe:
+                    self.breaker.release()
+
+    async def wait_for_budget(self) -> None:
+        """صبر تا زمانی که بودجه درخواست در دقیقه (GEMINI_RPM) اجازه دهد"""
+        delay = self.rpm_limiter.hit("gemini")
+        while delay:
+            await asyncio.sleep(delay)
+            delay = self.rpm_limiter.hit("gemini")
+
+    async def _request(self, prompt: str, instruction: Optional[str],
+                       generation_config: Optional[dict]):
+        await self.wait_for_budget()
+        async with self._semaphore:
+            started = time.monotonic()
+            try:
+                response = await asyncio.wait_for(
+                    self.client.aio.models.generate_content(
+                        model=self.model,
+                        contents=self.build_prompt(prompt, instruction),
+                        config=generation_config),
+                    timeout=self.timeout)
+            except Exception:
+                await api_quota.record("gemini")
+                raise
+            self.latency.record(time.monotonic() - started)
+            await api_quota.record("gemini", tokens=self.token_count(response))
+            return response
+
+    @staticmethod
+    def token_count(response) -> int:
+        """تعداد کل توکن‌های مصرف‌شده طبق usage_metadata پاسخ"""
+        usage = getattr(response, "usage_metadata", None)
+        return getattr(usage, "total_token_count", None) or 0
+
+    async def _generate(self, prompt: str, instruction: Optional[str],
+                        key: str, cache: bool,
+                        generation_config: Optional[dict]) -> Optional[str]:
+        # نزدیک به پایان بودجه روزانه فقط پاسخ‌های کش‌شده در دسترس هستند
+        if not await api_quota.allow("gemini"):
+            return None
 
-    async def generate_response(self, prompt: str) -> Optional[str]:
-        """تولید پاسخ از Gemini با مدیریت خطا"""
+        # درخواست پشتیبان بعد از تأخیر صدک ۹۵ ارسال می‌شود
+        self.hedge_delay = self.latency.percentile(0.95) if self.hedging else None
         try:
-            response = self.client.models.generate_content(model=self.model,
-                                                           contents=prompt)
+            response = await self._call_with_retry(lambda: hedged(
+                lambda: self._request(prompt, instruction, generation_config),
+                self.hedge_delay))
+            if cache and response.text:
+                await self.cache.set(key, response.text)
             return response.text
+        except CircuitOpenError:
+            logger.warning("Gemini circuit open, request rejected")
+            return None
+        except asyncio.TimeoutError:
+            logger.error(f"Gemini timeout after {self.timeout}s")
+            return None
         except Exception as e:
             logger.error(f"Gemini error: {str(e)}")
             return None
 
+    def health(self) -> dict:
+        """وضعیت سلامت اتصال به Gemini برای نمایش به مدیران"""
+        p95 = self.latency.percentile(0.95, min_samples=1)
+        return {
+            **self.breaker.info(),
+            'retries': self.retries,
+            'requests_last_minute': self.rpm_limiter.count("gemini"),
+            'p95': round(p95, 2) if p95 is not None else None
+        }
+
+    async def _stream(self, prompt: str, key: str,
+                      cache: bool) -> AsyncIterator[str]:
+        if not await api_quota.allow("gemini"):
+            return
+
+        pieces = []
+        tokens = 0
+        stream = None
+        streaming = False
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+
+        async def open_stream():
+            # درخواست با اولین __anext__ ارسال می‌شود، پس اولین تکه هم
+            # داخل تلاش تکرارپذیر دریافت می‌شود
+            nonlocal stream
+            stream = await self.client.aio.models.generate_content_stream(
+                model=self.model, contents=prompt)
+            try:
+                return await stream.__anext__()
+            except StopAsyncIteration:
+                return None
+
+        async def start_stream():
+            await self.wait_for_budget()
+            started = time.monotonic()
+            first = await asyncio.wait_for(open_stream(), timeout=self.timeout)
+            # تأخیر تا رسیدن اولین تکه
+            self.latency.record(time.monotonic() - started)
+            return first
+
+        async with self._semaphore:
+            try:
+                chunk = await self._call_with_retry(start_stream)
+                streaming = True
+                # بعد از اولین تکه امکان تکرار نیست
+                while chunk is not None:
+                    # تکه آخر مجموع توکن‌های مصرف‌شده را دارد
+                    tokens = self.token_count(chunk) or tokens
+                    if chunk.text:
+                        pieces.append(chunk.text)
+                        yield chunk.text
+                    try:
+                        chunk = await asyncio.wait_for(
+                            stream.__anext__(),
+                            timeout=max(deadline - loop.time(), 0))
+                    except StopAsyncIteration:
+                        chunk = None
+            except CircuitOpenError:
+                logger.warning("Gemini circuit open, stream rejected")
+            except asyncio.TimeoutError as e:
+                logger.error(f"Gemini stream timeout after {self.timeout}s")
+                if streaming:
+                    # بخشی از پاسخ ارسال شده؛ گیرنده باید از ناقص بودن آن باخبر شود
+                    self.breaker.record_failure()
+                    raise StreamInterrupted("stream timed out") from e
+            except Exception as e:
+                logger.error(f"Gemini stream error: {str(e)}")
+                if streaming:
+                    self.breaker.record_failure()
+                    raise StreamInterrupted(str(e)) from e
+            else:
+                # فقط پاسخ‌های کامل ذخیره می‌شوند
+                if cache and pieces:
+                    await self.cache.set(key, "".join(pieces))
+            finally:
+                if stream is not None:
+                    await api_quota.record("gemini", tokens=tokens)
+
+
+class TranslationEngine:
+    """
+    ترجمه یک پیام به همه زبان‌ها در یک فراخوانی (پاسخ JSON)
+
+    هر زبان جداگانه با کلید (چت، آیدی پیام، هش متن) کش می‌شود تا
+    درخواست‌های بعدی ترجمه همان پیام بدون فراخوانی API و سهمیه پاسخ داده شوند.
+    """
+    LANGUAGES = {
+        "fa": "این متن را به فارسی ترجمه کن",
+        "en": "Translate this text to English",
+        "ja": "Translate this text to Japanese"
+    }
+    MULTI_INSTRUCTION = (
+        "Translate the following text into Persian, English and Japanese. "
+        "Respond only with a JSON object with the keys \"fa\", \"en\" and "
+        "\"ja\" whose values are the translations")
+
+    def __init__(self, bot: GeminiBot):
+        self.bot = bot
+        self.cache = TieredCache("translations",
+                                 maxsize=GEMINI_CACHE_SIZE,
+                                 ttl=TRANSLATION_CACHE_TTL,
+                                 persistent=True)
+
+    @staticmethod
+    def message_key(chat_id: int, message_id: int, text: str) -> str:
+        digest = hashlib.sha256(
+            PersianTextNormalizer.normalize(text).encode()).hexdigest()[:16]
+        return f"{chat_id}:{message_id}:{digest}"
+
+    async def get_cached(self, chat_id: int, message_id: int, text: str,
+                         lang: str) -> Optional[str]:
+        """ترجمه ذخیره‌شده این پیام به زبان خواسته‌شده"""
+        key = self.message_key(chat_id, message_id, text)
+        cached = await self.cache.get(f"{key}:{lang}")
+        if cached:
+            return cached
+
+        # همین متن ممکن است قبلاً در پیام دیگری ترجمه شده باشد
+        raw = await self.bot.get_cached(text, self.MULTI_INSTRUCTION)
+        translations = await self._store(key, raw) if raw else None
+        return translations.get(lang) if translations else None
+
+    async def translate(self,
+                        chat_id: int,
+                        message_id: int,
+                        text: str,
+                        lang: str,
+                        cache: bool = True) -> Optional[str]:
+        """ترجمه پیام؛ در اولین درخواست همه زبان‌ها با هم ترجمه می‌شوند"""
+        key = self.message_key(chat_id, message_id, text)
+        if cache:
+            cached = await self.cache.get(f"{key}:{lang}")
+            if cached:
+                return cached
+
+        if len(text) > TRANSLATION_CHUNK_SIZE:
+            translated = await self._translate_chunked(text, lang, cache)
+            if translated:
+                await self.cache.set(f"{key}:{lang}", translated)
+            return translated
+
+        raw = await self.bot.generate_response(
+            text,
+            instruction=self.MULTI_INSTRUCTION,
+            cache=cache,
+            generation_config={"response_mime_type": "application/json"})
+        translations = await self._store(key, raw) if raw else None
+        if translations and translations.get(lang):
+            return translations[lang]
+
+        # در صورت خرابی JSON فقط همین زبان ترجمه می‌شود
+        return await self.bot.generate_response(
+            text, instruction=self.LANGUAGES[lang], cache=cache)
+
+    async def _translate_chunked(self, text: str, lang: str,
+                                 cache: bool) -> Optional[str]:
+        """
+        ترجمه موازی متن طولانی
+
+        متن در مرز پاراگراف/جمله تقسیم و حداکثر `TRANSLATION_PARALLEL_CHUNKS`
+        تکه هم‌زمان ترجمه می‌شوند؛ هر تکه یک درخواست از بودجه GEMINI_RPM است.
+        """
+        chunks = split_on_boundaries(text, TRANSLATION_CHUNK_SIZE)
+        slots = asyncio.Semaphore(TRANSLATION_PARALLEL_CHUNKS)
+
+        async def translate_chunk(chunk: str) -> Optional[str]:
+            async with slots:
+                return await self.bot.generate_response(
+                    chunk, instruction=self.LANGUAGES[lang], cache=cache)
+
+        results = await asyncio.gather(*map(translate_chunk, chunks))
+        if not all(results):
+            logger.error(f"Chunked translation failed "
+                         f"({results.count(None)}/{len(chunks)} chunks)")
+            return None
+        return "\n\n".join(result.strip() for result in results)
+
+    async def _store(self, key: str, raw: str) -> Optional[dict]:
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            logger.warning("Invalid JSON in multi-language translation")
+            return None
+        if not isinstance(data, dict):
+            return None
+
+        translations = {
+            lang: text.strip()
+            for lang, text in data.items()
+            if lang in self.LANGUAGES and isinstance(text, str) and text.strip()
+        }
+        for lang, text in translations.items():
+            await self.cache.set(f"{key}:{lang}", text)
+        return translations
+
 
 gemini_bot = GeminiBot()
+translator = TranslationEngine(gemini_bot)
+gemini_scheduler = PriorityScheduler(workers=GEMINI_MAX_CONCURRENCY,
+                                     max_queue=GEMINI_QUEUE_LIMIT)
 
 
 @register_command(["هیدن", "gemini", "جمنای"], "")
-@rate_limit(limit=5, interval=60)
+@rate_limit(*GEMINI_RATE_LIMIT, bucket="gemini")
 @require_permission(level=1)
 async def gemini_handler(client: Client, message: Message):
     """
@@ -79,19 +475,50 @@ async def send_welcome_message(client: Client, message: Message):
 
 async def process_gemini_request(client: Client, message: Message):
     """پردازش اصلی درخواست‌های Gemini"""
-    if not await check_gemini_usage(message):
-        return
-
     query = extract_query(message)
     if not validate_query(query):
         await message.reply("⚠️ لطفاً سوال معتبری وارد کنید (حداقل ۳ کاراکتر)")
         return
 
+    # پاسخ‌های موجود در کش از سهمیه روزانه کم نمی‌کنند و در صف نمی‌روند
+    use_cache = cache_enabled("gemini")
+    cached = await gemini_bot.get_cached(query) if use_cache else None
+    if cached:
+        await answer_gemini_request(message, query, cached, use_cache)
+    else:
+        await schedule_gemini(
+            message, lambda: answer_gemini_request(message, query, None,
+                                                   use_cache))
+
+
+async def answer_gemini_request(message: Message, query: str,
+                                cached: Optional[str], use_cache: bool):
+    """تولید و ارسال پاسخ سوال (با پاسخ کش‌شده یا فراخوانی مدل)"""
+    if not cached and not await check_gemini_usage(message):
+        return
+
     # نمایش پیام در حال پردازش با انیمیشن
     processing_msg = await message.reply("🌌 در حال پردازش سوال شما...")
 
     try:
-        response = await gemini_bot.generate_response(query)
+        if cached:
+            response = cached
+        elif GEMINI_STREAMING:
+            streamer = await stream_gemini_response(
+                processing_msg,
+                query,
+                header="💎 <b>پاسخ به سوال شما:</b>\n\n",
+                cache=use_cache)
+            response = streamer.text
+            if streamer.interrupted:
+                await refund_gemini_usage(message)
+            if response and len(streamer.messages) > 1:
+                # پاسخ در چند پیام ارسال شده؛ فقط پیام آخر نهایی می‌شود
+                await streamer.finish()
+                return
+        else:
+            response = await gemini_bot.generate_response(query,
+                                                          cache=use_cache)
         if response:
             formatted_response = format_response(response, message)
             # ارسال پاسخ با قالب زیبا
@@ -100,48 +527,245 @@ async def process_gemini_request(client: Client, message: Message):
                 parse_mode=ParseMode.HTML,
                 disable_web_page_preview=True)
         else:
+            await refund_gemini_usage(message)
             await processing_msg.edit_text(
                 "⚠️ خطا در پردازش سوال. لطفاً مجدد تلاش کنید.")
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
+        if not cached:
+            await refund_gemini_usage(message)
         await processing_msg.edit_text("⚠️ خطای سیستمی. لطفاً بعداً تلاش کنید."
                                        )
 
 
+async def stream_gemini_response(processing_msg: Message,
+                                 prompt: str,
+                                 header: str = "",
+                                 rollover: bool = True,
+                                 cache: bool = False) -> StreamingMessage:
+    """
+    دریافت تدریجی پاسخ Gemini و ویرایش هم‌زمان پیام در حال پردازش
+
+    اگر جریان در میانه قطع شود، `streamer.interrupted` برابر True است و
+    متن با هشدار ناقص بودن پاسخ تمام می‌شود.
+    """
+    streamer = StreamingMessage(processing_msg,
+                                header=header,
+                                rollover=rollover)
+    try:
+        async for piece in gemini_bot.stream_response(prompt, cache=cache):
+            await streamer.feed(piece)
+    except StreamInterrupted as e:
+        logger.warning(f"Gemini stream interrupted: {str(e)}")
+        if streamer.text:
+            await streamer.interrupt()
+    return streamer
+
+
 @register_command("فارسیش", "")
-@rate_limit(limit=3, interval=30)
+@rate_limit(*GEMINI_RATE_LIMIT, bucket="gemini")
 @require_permission(level=1)
 async def translate_fa_handler(client: Client, message: Message):
     """ترجمه متن به فارسی"""
-    await handle_translation(message, "این متن را به فارسی ترجمه کن")
+    await handle_translation(message, "fa")
 
 
 @register_command("انگلیسیش", "")
-@rate_limit(limit=3, interval=30)
+@rate_limit(*GEMINI_RATE_LIMIT, bucket="gemini")
 @require_permission(level=1)
 async def translate_en_handler(client: Client, message: Message):
     """ترجمه متن به انگلیسی"""
-    await handle_translation(message, "Translate this text to English")
+    await handle_translation(message, "en")
 
 
 @register_command("ژاپنیش", "")
-@rate_limit(limit=3, interval=30)
+@rate_limit(*GEMINI_RATE_LIMIT, bucket="gemini")
 @require_permission(level=1)
 async def translate_jp_handler(client: Client, message: Message):
     """ترجمه متن به ژاپنی"""
-    await handle_translation(message, "Translate this text to Japanese")
+    await handle_translation(message, "ja")
+
+
+@register_command(["بپرس", "ask"], "")
+@rate_limit(*GEMINI_RATE_LIMIT, bucket="gemini")
+@require_permission(level=1)
+async def grounded_answer_handler(client: Client, message: Message):
+    """
+    پاسخ مستند به نتایج زنده جستجوی گوگل
+    استفاده:
+    بپرس [سوال]
+    """
+    parts = message.text.split(maxsplit=1)
+    query = parts[1].strip() if len(parts) > 1 else ""
+    if not validate_query(query):
+        await message.reply("⚠️ لطفاً سوال معتبری وارد کنید (حداقل ۳ کاراکتر)")
+        return
+
+    await schedule_gemini(message, lambda: answer_with_search(message, query))
+
+
+async def answer_with_search(message: Message, query: str):
+    """
+    جستجو و پیش‌نویس پاسخ به صورت هم‌زمان، سپس پاسخ نهایی مستند به منابع
+
+    هر دو مرحله از کش جستجو و (در صورت فعال بودن "ask") کش پاسخ استفاده می‌کنند.
+    """
+    if not await check_gemini_usage(message):
+        return
+
+    processing_msg = await message.reply("🔎 در حال جستجو و آماده‌سازی پاسخ...")
+    try:
+        search_results, draft = await asyncio.gather(
+            google_searcher.search(query),
+            gemini_bot.generate_response(
+                query,
+                instruction="Answer this question briefly",
+                cache=cache_enabled("ask")))
+
+        items = (search_results or {}).get('items', [])[:GROUNDED_SOURCES]
+        if not items and not draft:
+            await refund_gemini_usage(message)
+            await processing_msg.edit_text(
+                "⚠️ خطا در پردازش سوال. لطفاً مجدد تلاش کنید.")
+            return
+
+        sources = format_search_results(query, {'items': items}) or []
+        prompt = build_grounded_prompt(query, draft, sources[1:])
+
+        streamer = await stream_gemini_response(
+            processing_msg,
+            prompt,
+            header="💎 <b>پاسخ بر اساس جستجو:</b>\n\n",
+            cache=cache_enabled("ask"))
+        if not streamer.text:
+            await refund_gemini_usage(message)
+            await processing_msg.edit_text(
+                "⚠️ خطا در پردازش سوال. لطفاً مجدد تلاش کنید.")
+            return
+        if streamer.interrupted:
+            await refund_gemini_usage(message)
+
+        links = "\n".join(
+            f"{idx}. <a href='{item.get('link', '#')}'>"
+            f"{item.get('title', 'بدون عنوان')}</a>"
+            for idx, item in enumerate(items, 1))
+        if not links:
+            await streamer.finish()
+        elif len(streamer.messages) == 1 and len(streamer.part) + len(
+                links) < 3800:
+            streamer.text += f"\n\n📚 <b>منابع:</b>\n{links}"
+            await streamer.finish()
+        else:
+            await streamer.finish()
+            await message.reply(f"📚 <b>منابع:</b>\n{links}",
+                                parse_mode=ParseMode.HTML,
+                                disable_web_page_preview=True)
+    except Exception as e:
+        logger.error(f"Error in grounded answer: {str(e)}")
+        await refund_gemini_usage(message)
+        await processing_msg.edit_text("⚠️ خطای سیستمی. لطفاً بعداً تلاش کنید.")
+
+
+def build_grounded_prompt(query: str, draft: Optional[str],
+                          sources: list[str]) -> str:
+    """ساخت پرسش نهایی از سوال، پیش‌نویس و نتایج جستجو"""
+    sections = [
+        "Answer the question below in the same language as the question.",
+        "Use the numbered search results as the primary source of facts, "
+        "cite them like [1], and correct the draft answer where the results "
+        "disagree with it.", "", f"Question: {query}"
+    ]
+    if draft:
+        sections += ["", f"Draft answer:\n{draft}"]
+    if sources:
+        sections += ["", "Search results:", *sources]
+    return "\n".join(sections)
 
 
 # توابع کمکی
+# ارجاع به تسک‌های منتظر کارهای صف تا توسط GC جمع‌آوری نشوند
+scheduled_jobs: set[asyncio.Task] = set()
+
+
+async def schedule_gemini(message: Message,
+                          job: Callable[[], Awaitable]) -> None:
+    """
+    ثبت کار Gemini در صف اولویت‌دار
+
+    اولویت از سطح دسترسی کاربر گرفته می‌شود؛ اگر صف پر باشد درخواست
+    با پیام «مشغول» رد می‌شود و اگر در صف بماند جایگاهش اعلام می‌شود.
+    هندلر منتظر اتمام کار نمی‌ماند تا worker پایروگرام آزاد شود.
+    """
+    user_id = message.from_user.id
+    level = await get_user_permission_async(user_id)
+    queue_notices = []
+
+    async def run():
+        # با شروع کار، پیام «در صف» حذف می‌شود
+        await delete_notices(queue_notices)
+        token = request_user.set(user_id)
+        try:
+            return await job()
+        finally:
+            request_user.reset(token)
+
+    try:
+        future, position = gemini_scheduler.submit(user_id, level, run)
+    except SchedulerBusy as e:
+        await message.reply(
+            f"⏳ ربات مشغول است (نوبت شما: {e.position}). لطفاً کمی بعد تلاش کنید")
+        return None
+
+    if position > GEMINI_MAX_CONCURRENCY:
+        queue_notices.append(await message.reply(
+            f"⏳ در صف انتظار... نوبت شما: {position}"))
+    watcher = asyncio.ensure_future(wait_for_job(future, queue_notices))
+    scheduled_jobs.add(watcher)
+    watcher.add_done_callback(scheduled_jobs.discard)
+
+
+async def wait_for_job(future: asyncio.Future, notices: list[Message]):
+    """انتظار برای پایان کار زمان‌بندی‌شده و حذف پیام‌های «در صف»"""
+    try:
+        await future
+    except Exception:
+        pass  # خطای کار در زمان‌بند لاگ شده است
+    finally:
+        await delete_notices(notices)
+
+
+async def delete_notices(notices: list[Message]):
+    """حذف پیام‌های موقت"""
+    while notices:
+        try:
+            await notices.pop().delete()
+        except Exception as e:
+            logger.warning(f"Couldn't delete notice: {str(e)}")
+
+
+def cache_enabled(command: str) -> bool:
+    """بررسی فعال بودن کش پاسخ برای یک دستور"""
+    return command in GEMINI_CACHE_COMMANDS
+
+
 async def check_gemini_usage(message: Message) -> bool:
     """بررسی سهمیه استفاده از Gemini"""
-    if not can_use_gemini(message.from_user.id):
+    if not await api_quota.allow("gemini"):
+        await message.reply(
+            "⚠️ سهمیه روزانه سرویس رو به اتمام است؛ فعلاً فقط پاسخ سوال‌های "
+            "تکراری در دسترس است")
+        return False
+    if not await gemini_quota.try_use(message.from_user.id):
         await message.reply("⚠️ سهمیه روزانه شما تمام شده است!")
         return False
-    increment_gemini_usage(message.from_user.id)
     return True
 
 
+async def refund_gemini_usage(message: Message):
+    """بازگرداندن سهمیه وقتی درخواست در نهایت ناموفق بوده است"""
+    await gemini_quota.refund(message.from_user.id)
+
+
 def extract_query(message: Message) -> str:
     """استخراج متن سوال از پیام"""
     if message.text.startswith(("هیدن ", "gemini ", "جمنای ")):
@@ -158,46 +782,83 @@ def validate_query(query: str) -> bool:
 
 async def handle_response(temp_msg: Message, original_msg: Message,
                           response: Optional[str]):
-    """مدیریت پاسخ و خطاها"""
-    if response:
+    """مدیریت پاسخ و خطاها (سهمیه درخواست ناموفق برگردانده می‌شود)"""
+    if response and len(response) > 3900:
+        # پاسخ طولانی در چند پیام جداگانه ارسال می‌شود
+        parts = split_on_boundaries(response, 3900)
+        await temp_msg.edit_text(parts[0])
+        for part in parts[1:]:
+            await original_msg.reply(part)
+    elif response:
         await temp_msg.edit_text(format_response(response, original_msg))
     else:
+        await refund_gemini_usage(original_msg)
         await temp_msg.edit_text(
             "⚠️ خطا در پردازش درخواست. لطفاً بعداً تلاش کنید.")
 
 
-async def handle_translation(message: Message, prompt: str):
+async def handle_translation(message: Message, lang: str):
     """مدیریت ترجمه متون"""
     if not message.reply_to_message:
         await message.reply("⚠️ لطفاً به پیام مورد نظر ریپلای کنید")
         return
 
-    if not await check_gemini_usage(message):
+    source = message.reply_to_message
+    if not source.text:
+        await message.reply("⚠️ لطفاً به یک پیام متنی ریپلای کنید")
         return
 
-    temp_msg = await message.reply("🔍 در حال ترجمه...")
-    text_to_translate = f"{prompt}:\n{message.reply_to_message.text}"
-    translated_text = await gemini_bot.generate_response(text_to_translate)
+    use_cache = cache_enabled("translate")
+    if use_cache:
+        cached = await translator.get_cached(source.chat.id, source.id,
+                                             source.text, lang)
+        if cached:
+            await message.reply(format_response(cached, message))
+            return
+
+    async def job():
+        if not await check_gemini_usage(message):
+            return
+
+        temp_msg = await message.reply("🔍 در حال ترجمه...")
+        translated_text = await translator.translate(source.chat.id,
+                                                     source.id,
+                                                     source.text,
+                                                     lang,
+                                                     cache=use_cache)
 
-    await handle_response(temp_msg, message, translated_text)
+        await handle_response(temp_msg, message, translated_text)
+
+    await schedule_gemini(message, job)
 
 
 # هندلر جدید برای مدیریت ریپلای‌ها
-@rate_limit(limit=5, interval=60)
+@rate_limit(*GEMINI_RATE_LIMIT, bucket="gemini")
 async def gemini_reply_handler(client: Client, message: Message):
     """مدیریت درخواست‌های ریپلای شده به Gemini"""
-    if not await check_gemini_usage(message):
-        return
-
     if not message.reply_to_message or not message.reply_to_message.text:
         await message.reply("⚠️ لطفاً به یک پیام متنی ریپلای کنید")
         return
 
-    temp_msg = await message.reply("🔮 در حال پردازش...")
-    response = await gemini_bot.generate_response(message.reply_to_message.text
-                                                  )
+    question = message.reply_to_message.text
+    use_cache = cache_enabled("reply")
+    if use_cache:
+        cached = await gemini_bot.get_cached(question)
+        if cached:
+            await message.reply(format_response(cached, message))
+            return
+
+    async def job():
+        if not await check_gemini_usage(message):
+            return
 
-    await handle_response(temp_msg, message, response)
+        temp_msg = await message.reply("🔮 در حال پردازش...")
+        response = await gemini_bot.generate_response(question,
+                                                      cache=use_cache)
+
+        await handle_response(temp_msg, message, response)
+
+    await schedule_gemini(message, job)
 
 
 
@@ -218,6 +879,12 @@ def register_gemini_handlers(app: Client):
             filters.command(cmd, prefixes=["", "/", "!"])
         ))
 
+    # هندلر پاسخ مستند به جستجو
+    app.add_handler(MessageHandler(
+        grounded_answer_handler,
+        filters.command(["بپرس", "ask"], prefixes=["", "/", "!"])
+    ))
+
     # هندلر ریپلای‌ها
     app.add_handler(MessageHandler(
         gemini_reply_handler,
@@ -1,52 +1,166 @@
 # handlers\google.py
-import requests
+import httpx
+import hashlib
+import importlib.util
 from pyrogram import Client
 from pyrogram import filters
-from pyrogram.types import Message
-from typing import List, Dict, Optional
+from pyrogram.types import (Message, CallbackQuery, InlineKeyboardMarkup,
+                            InlineKeyboardButton)
+from typing import List, Dict, Optional, Tuple
+import config
 from config import GOOGLE_API_KEY, GOOGLE_CX
-from utils.decorators import register_command, rate_limit
-from utils.helpers import format_response, split_long_text
+from utils.decorators import register_command, rate_limit, active_only
+from utils.helpers import split_long_text
+from utils.lifecycle import on_shutdown
+from utils.cache import TieredCache
+from utils.quota import api_quota
+from utils.converters import PersianTextNormalizer
 import logging
-from pyrogram.handlers import MessageHandler
+from pyrogram.handlers import MessageHandler, CallbackQueryHandler
 
 # تنظیمات لاگ‌گیری
 logger = logging.getLogger(__name__)
 
+# تنظیمات اتصال HTTP (مهلت‌ها به ثانیه)
+GOOGLE_TIMEOUT = getattr(config, "GOOGLE_TIMEOUT", 15)
+GOOGLE_CONNECT_TIMEOUT = getattr(config, "GOOGLE_CONNECT_TIMEOUT", 5)
+GOOGLE_MAX_CONNECTIONS = getattr(config, "GOOGLE_MAX_CONNECTIONS", 20)
+GOOGLE_MAX_KEEPALIVE = getattr(config, "GOOGLE_MAX_KEEPALIVE", 10)
+# کش نتایج جستجو (سهمیه روزانه Custom Search محدود و پولی است)
+GOOGLE_CACHE_SIZE = getattr(config, "GOOGLE_CACHE_SIZE", 500)
+GOOGLE_CACHE_TTL = getattr(config, "GOOGLE_CACHE_TTL", 6 * 3600)
+# تعداد نتیجه در هر صفحه از نمایش صفحه‌بندی‌شده
+GOOGLE_PAGE_SIZE = getattr(config, "GOOGLE_PAGE_SIZE", 5)
+# HTTP/2 فقط در صورت نصب بودن بسته h2
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
 
 class GoogleSearch:
     def __init__(self):
         self.base_url = "https://customsearch.googleapis.com/customsearch/v1"
-        self.timeout = 15
+        self.timeout = GOOGLE_TIMEOUT
         self.max_results = 10
+        self._client: Optional[httpx.AsyncClient] = None
+        self.cache = TieredCache("google_results",
+                                 maxsize=GOOGLE_CACHE_SIZE,
+                                 ttl=GOOGLE_CACHE_TTL,
+                                 persistent=True)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """کلاینت HTTP مشترک با اتصال‌های ماندگار (در اولین استفاده ساخته می‌شود)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                timeout=httpx.Timeout(self.timeout,
+                                      connect=GOOGLE_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=GOOGLE_MAX_CONNECTIONS,
+                    max_keepalive_connections=GOOGLE_MAX_KEEPALIVE))
+        return self._client
+
+    async def close(self):
+        """بستن اتصال‌های باز"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @staticmethod
+    def cache_key(query: str, num: int, start: int) -> str:
+        normalized = PersianTextNormalizer.normalize(query)
+        return hashlib.sha256(
+            f"{normalized}|{num}|{start}".encode()).hexdigest()
+
+    @staticmethod
+    def compact(results: Dict) -> Dict:
+        """نگهداری فقط فیلدهای لازم برای نمایش نتایج"""
+        return {
+            'items': [{
+                field: item[field]
+                for field in ('title', 'link', 'snippet') if field in item
+            } for item in results.get('items', [])]
+        }
+
+    async def search(self,
+                     query: str,
+                     num: Optional[int] = None,
+                     start: int = 1) -> Optional[Dict]:
+        """انجام جستجوی گوگل با مدیریت خطا (نتایج تکراری از کش خوانده می‌شوند)"""
+        num = num or self.max_results
+        key = self.cache_key(query, num, start)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        # نزدیک به پایان بودجه روزانه فقط نتایج کش‌شده برگردانده می‌شوند
+        if not await api_quota.allow("google"):
+            return None
 
-    async def search(self, query: str) -> Optional[Dict]:
-        """انجام جستجوی گوگل با مدیریت خطا"""
         params = {
             'cx': GOOGLE_CX,
             'q': query,
             'key': GOOGLE_API_KEY,
-            'num': self.max_results
+            'num': num,
+            'start': start
         }
 
         try:
-            response = requests.get(
-                self.base_url,
-                params=params,
-                timeout=self.timeout
-            )
+            response = await self.client.get(self.base_url, params=params)
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            results = self.compact(response.json())
+        except httpx.HTTPError as e:
             logger.error(f"Google search error: {str(e)}")
             return None
+        finally:
+            await api_quota.record("google")
+
+        await self.cache.set(key, results)
+        return results
+
+    async def get_page(self, query: str, page: int,
+                       page_size: int) -> Optional[Tuple[List[Dict], bool]]:
+        """
+        دریافت یک صفحه از نتایج
+
+        نتایج در دسته‌های ۱۰تایی (حداکثر مجاز API) و فقط هنگام نیاز گرفته
+        می‌شوند؛ صفحه‌های داخل یک دسته از کش خوانده می‌شوند.
+
+        Returns:
+            (نتایج صفحه, وجود صفحه بعد) یا None در صورت خطا
+        """
+        first = (page - 1) * page_size
+        offset = first - first % self.max_results
+        items = []
+        more = True
+        while offset < first + page_size and more:
+            results = await self.search(query, start=offset + 1)
+            if results is None:
+                return None
+            batch = results.get('items', [])
+            items.extend(batch)
+            # API حداکثر ۱۰۰ نتیجه اول را برمی‌گرداند
+            more = (len(batch) == self.max_results
+                    and offset + self.max_results < 100)
+            offset += self.max_results
+
+        start = first % self.max_results
+        page_items = items[start:start + page_size]
+        has_next = len(items) > start + page_size or more
+        return page_items, has_next
 
 
 google_searcher = GoogleSearch()
+on_shutdown(google_searcher.close)
+
+# نگهداری عبارت جستجو برای دکمه‌های صفحه‌بندی
+search_sessions = TieredCache("google_sessions",
+                              maxsize=2000,
+                              ttl=24 * 3600,
+                              persistent=True)
 
 
 @register_command(["گوگل", "جستجو", "search"])
-@rate_limit(limit=3, interval=30)
+@rate_limit(limit=3, interval=30, bucket="google")
 async def google_search_handler(client: Client, message: Message):
     """
     جستجوی پیشرفته در گوگل
@@ -64,20 +178,51 @@ async def google_search_handler(client: Client, message: Message):
     # نمایش وضعیت جستجو
     temp_msg = await message.reply("🔍 در حال جستجو در گوگل...")
 
-    # انجام جستجو
-    search_results = await google_searcher.search(query)
-    if not search_results:
-        await temp_msg.edit_text("⚠️ خطا در اتصال به سرویس گوگل")
+    # انجام جستجو (فقط صفحه اول)
+    page = await google_searcher.get_page(query, 1, GOOGLE_PAGE_SIZE)
+    if page is None:
+        await temp_msg.edit_text(search_error_text())
         return
 
-    # پردازش نتایج
-    formatted_results = format_search_results(query, search_results)
-    if not formatted_results:
+    items, has_next = page
+    if not items:
         await temp_msg.edit_text("⚠️ نتیجه‌ای برای جستجوی شما یافت نشد")
         return
 
+    session_id = hashlib.sha256(
+        PersianTextNormalizer.normalize(query).encode()).hexdigest()[:16]
+    await search_sessions.set(session_id, query)
+
     # ارسال نتایج
-    await send_search_results(client, temp_msg, message, formatted_results)
+    await send_search_page(temp_msg, session_id, query, items, 1, has_next)
+
+
+@active_only
+@rate_limit(limit=3, interval=30, bucket="google")
+async def google_page_handler(client: Client, callback_query: CallbackQuery):
+    """نمایش صفحه دیگری از نتایج جستجو (هم‌سهمیه با دستور جستجو)"""
+    _, session_id, page = callback_query.data.split(":")
+    page = int(page)
+    query = await search_sessions.get(session_id)
+    if not query:
+        await callback_query.answer("⚠️ این جستجو منقضی شده است",
+                                    show_alert=True)
+        return
+
+    result = await google_searcher.get_page(query, page, GOOGLE_PAGE_SIZE)
+    if result is None:
+        await callback_query.answer(search_error_text(), show_alert=True)
+        return
+
+    items, has_next = result
+    if not items:
+        await callback_query.answer("✅ نتیجه دیگری وجود ندارد",
+                                    show_alert=True)
+        return
+
+    await callback_query.answer()
+    await send_search_page(callback_query.message, session_id, query, items,
+                           page, has_next)
 
 
 # توابع کمکی
@@ -87,14 +232,23 @@ def extract_search_query(message: Message) -> Optional[str]:
     return command[1].strip() if len(command) > 1 else None
 
 
-def format_search_results(query: str, results: Dict) -> Optional[List[str]]:
+def search_error_text() -> str:
+    """متن خطای جستجو (تمام شدن بودجه روزانه یا خطای اتصال)"""
+    if api_quota.state("google") != api_quota.OK:
+        return "⚠️ سهمیه روزانه جستجو رو به اتمام است؛ لطفاً بعداً تلاش کنید"
+    return "⚠️ خطا در اتصال به سرویس گوگل"
+
+
+def format_search_results(query: str,
+                          results: Dict,
+                          start_index: int = 1) -> Optional[List[str]]:
     """قالب‌بندی نتایج جستجو"""
     if 'items' not in results or not results['items']:
         return None
 
     formatted = [f"🔍 نتایج جستجو برای: <b>{query}</b>\n"]
 
-    for idx, item in enumerate(results['items'], 1):
+    for idx, item in enumerate(results['items'], start_index):
         title = item.get('title', 'بدون عنوان')
         link = item.get('link', '#')
         snippet = item.get('snippet', 'بدون توضیحات')
@@ -107,31 +261,34 @@ def format_search_results(query: str, results: Dict) -> Optional[List[str]]:
     return formatted
 
 
-async def send_search_results(
-    client: Client,
-    temp_msg: Message,
-    original_msg: Message,
-    results: List[str]
+async def send_search_page(
+    target_msg: Message,
+    session_id: str,
+    query: str,
+    items: List[Dict],
+    page: int,
+    has_next: bool
 ):
-    """ارسال نتایج جستجو با مدیریت پیام‌های طولانی"""
-    full_text = '\n'.join(results)
-
-    # اگر متن خیلی طولانی باشد، آن را تقسیم می‌کنیم
-    if len(full_text) > 4000:
-        parts = split_long_text(full_text, 4000)
-        await temp_msg.delete()
-
-        for part in parts:
-            await client.send_message(
-                chat_id=original_msg.chat.id,
-                text=format_response(part, original_msg),
-                disable_web_page_preview=True
-            )
-    else:
-        await temp_msg.edit_text(
-            format_response(full_text, original_msg),
-            disable_web_page_preview=True
-        )
+    """نمایش یک صفحه از نتایج با دکمه‌های قبلی/بعدی در همان پیام"""
+    start_index = (page - 1) * GOOGLE_PAGE_SIZE + 1
+    results = format_search_results(query, {'items': items}, start_index)
+    text = '\n'.join(results) + f"\n📄 صفحه {page}"
+    # هر صفحه در یک پیام جا می‌شود
+    text = split_long_text(text, 4000)[0]
+
+    buttons = []
+    if page > 1:
+        buttons.append(InlineKeyboardButton(
+            "⬅️ قبلی", callback_data=f"gpage:{session_id}:{page - 1}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton(
+            "بعدی ➡️", callback_data=f"gpage:{session_id}:{page + 1}"))
+
+    await target_msg.edit_text(
+        text,
+        disable_web_page_preview=True,
+        reply_markup=InlineKeyboardMarkup([buttons]) if buttons else None
+    )
 
 
 def register_google_handlers(app: Client):
@@ -152,3 +309,7 @@ def register_google_handlers(app: Client):
             ),
             group=2  # گروه متوسط برای اولویت اجرا
         )
+
+    # صفحه‌بندی نتایج
+    app.add_handler(
+        CallbackQueryHandler(google_page_handler, filters.regex("^gpage:")))
@@ -0,0 +1,161 @@
+# handlers\history.py
+import datetime
+import hashlib
+import html
+import logging
+import re
+from pyrogram import Client, filters
+from pyrogram.enums import ChatType
+from pyrogram.types import (Message, CallbackQuery, InlineKeyboardMarkup,
+                            InlineKeyboardButton)
+from pyrogram.handlers import MessageHandler, CallbackQueryHandler
+from config import OWNER_ID
+from database.utils import get_user_permission_async, run_db
+from utils.cache import TieredCache
+from utils.converters import PersianTextNormalizer, persian_numbers
+from utils.decorators import require_permission, register_command
+from utils.history import message_recorder, search_history, HISTORY_ENABLED
+
+# تنظیمات لاگ‌گیری
+logger = logging.getLogger(__name__)
+
+# تعداد نتیجه در هر صفحه جستجوی تاریخچه
+HISTORY_SEARCH_PAGE_SIZE = 5
+
+# نگهداری عبارت جستجوی تاریخچه برای دکمه‌های صفحه‌بندی
+history_searches = TieredCache("history_searches", maxsize=500, ttl=3600)
+
+
+async def history_handler(client: Client, message: Message):
+    """ثبت پیام در تاریخچه (فقط افزودن به صف؛ پردازش بقیه هندلرها ادامه دارد)"""
+    message_recorder.capture(message)
+
+
+@register_command("تاریخچه", "")
+@require_permission(level=2)
+async def history_search_handler(client: Client, message: Message):
+    """
+    جستجو در تاریخچه پیام‌ها
+    استفاده:
+    تاریخچه [عبارت] [از:1403/07/01] [تا:1403/07/30]
+    """
+    parts = message.text.split(maxsplit=1)
+    args = parts[1] if len(parts) > 1 else ""
+    try:
+        search = parse_history_search(args)
+    except ValueError:
+        await message.reply("⚠️ تاریخ نامعتبر است. فرمت صحیح: از:1403/07/01")
+        return
+    if not search['query']:
+        await message.reply(
+            "⚠️ لطفاً عبارت جستجو را وارد کنید\nمثال:\n"
+            "`تاریخچه قیمت دلار از:1403/07/01 تا:1403/07/30`")
+        return
+
+    # فقط مالک در چت خصوصی همه چت‌ها را جستجو می‌کند؛ بقیه فقط همین چت را
+    if (message.chat.type == ChatType.PRIVATE
+            and message.from_user.id == OWNER_ID):
+        search['chat_id'] = None
+    else:
+        search['chat_id'] = message.chat.id
+
+    session_id = hashlib.sha256(
+        f"{search['chat_id']}:{PersianTextNormalizer.normalize(args)}".encode()
+    ).hexdigest()[:16]
+    await history_searches.set(session_id, search)
+    await send_history_page(message, session_id, search, 1)
+
+
+async def history_page_handler(client: Client, callback_query: CallbackQuery):
+    """نمایش صفحه دیگری از نتایج جستجوی تاریخچه"""
+    if await get_user_permission_async(callback_query.from_user.id) < 2:
+        await callback_query.answer("⛔ شما دسترسی لازم برای این کار را ندارید!",
+                                    show_alert=True)
+        return
+    _, session_id, page = callback_query.data.split(":")
+    search = await history_searches.get(session_id)
+    if not search:
+        await callback_query.answer("⚠️ این جستجو منقضی شده است",
+                                    show_alert=True)
+        return
+    await callback_query.answer()
+    await send_history_page(callback_query.message, session_id, search,
+                            int(page), edit=True)
+
+
+def parse_history_search(args: str) -> dict:
+    """جدا کردن بازه تاریخ شمسی (از:/تا:) از عبارت جستجو"""
+    search = {'query': args, 'since': None, 'until': None}
+    for key, name in (('since', 'از'), ('until', 'تا')):
+        match = re.search(rf"{name}:(\S+)", search['query'])
+        if match:
+            date = persian_numbers.to_gregorian(
+                PersianTextNormalizer.normalize(match.group(1)))
+            search[key] = date.isoformat()
+            search['query'] = search['query'].replace(match.group(0), "")
+    search['query'] = search['query'].strip()
+    return search
+
+
+async def send_history_page(target_msg: Message,
+                            session_id: str,
+                            search: dict,
+                            page: int,
+                            edit: bool = False):
+    """نمایش یک صفحه از نتایج جستجوی تاریخچه با دکمه‌های قبلی/بعدی"""
+    since = search['since'] and datetime.date.fromisoformat(search['since'])
+    until = search['until'] and datetime.date.fromisoformat(search['until'])
+    rows, has_next = await run_db(search_history, search['query'], page,
+                                  HISTORY_SEARCH_PAGE_SIZE, since, until,
+                                  search['chat_id'])
+    if not rows:
+        text = "⚠️ نتیجه‌ای در تاریخچه یافت نشد"
+    else:
+        lines = [f"🗂 نتایج تاریخچه برای: <b>{html.escape(search['query'])}</b>\n"]
+        start = (page - 1) * HISTORY_SEARCH_PAGE_SIZE + 1
+        for idx, row in enumerate(rows, start):
+            date = datetime.datetime.fromisoformat(row['date'])
+            sender = html.escape(
+                str(row['first_name'] or row['from_user_id'] or "ناشناس"))
+            snippet = html.escape((row['text'] or "")[:200])
+            link = ""
+            if str(row['chat_id']).startswith("-100"):
+                link = (f" | <a href='https://t.me/c/{str(row['chat_id'])[4:]}/"
+                        f"{row['message_id']}'>پیام</a>")
+            lines.append(
+                f"{idx}. 👤 {sender} | 📅 "
+                f"{persian_numbers.format_jalali(date, with_time=True)}{link}\n"
+                f"{snippet}\n")
+        text = "\n".join(lines) + f"\n📄 صفحه {page}"
+
+    buttons = []
+    if page > 1:
+        buttons.append(InlineKeyboardButton(
+            "⬅️ قبلی", callback_data=f"hsearch:{session_id}:{page - 1}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton(
+            "بعدی ➡️", callback_data=f"hsearch:{session_id}:{page + 1}"))
+    markup = InlineKeyboardMarkup([buttons]) if buttons else None
+
+    if edit:
+        await target_msg.edit_text(text,
+                                   disable_web_page_preview=True,
+                                   reply_markup=markup)
+    else:
+        await target_msg.reply(text,
+                               disable_web_page_preview=True,
+                               reply_markup=markup)
+
+
+def register_history_handlers(app: Client):
+    """ثبت جستجوی تاریخچه و هندلر ثبت پیام‌ها (قبل از همه گروه‌ها)"""
+    app.add_handler(
+        MessageHandler(history_search_handler, filters.command("تاریخچه", "")))
+    # صفحه‌بندی جستجوی تاریخچه
+    app.add_handler(
+        CallbackQueryHandler(history_page_handler, filters.regex("^hsearch:")))
+
+    if not HISTORY_ENABLED:
+        return
+    app.add_handler(MessageHandler(history_handler, filters.incoming),
+                    group=-1)
@@ -2,8 +2,7 @@
 from pyrogram import filters
 from pyrogram.types import Message
 from pyrogram.enums import ParseMode
-from config import OWNER_ID
-from database.models import User, Permission, GeminiUsage
+from database.utils import get_user_permission_async, gemini_quota
 from utils.decorators import register_command
 from utils.helpers import format_response, persian_numbers
 from datetime import datetime
@@ -43,6 +42,7 @@ async def help_handler(client, message: Message):
 فارسیش - ترجمه متن (با ریپلای)
 انگلیسیش - ترجمه به انگلیسی
 ژاپنیش - ترجمه به ژاپنی
+بپرس [سوال] - پاسخ مستند به نتایج جستجوی گوگل
 
 🔸 مدیریت کاربران:
 کاربر ادمین [ریپلای] - ارتقا به ادمین
@@ -52,6 +52,11 @@ async def help_handler(client, message: Message):
 🔸 مدیریت ربات:
 بات روشن - روشن کردن ربات
 بات خاموش - خاموش کردن ربات
+آمار کش - نمایش آمار کش‌ها
+آمار جمنای - نمایش آمار فراخوانی‌های Gemini
+مصرف سرویس - نمایش مصرف روزانه Google و Gemini
+تاریخچه [عبارت] [از:تاریخ] [تا:تاریخ] - جستجو در تاریخچه پیام‌ها
+نگهداری دیتابیس - آرشیو داده‌های قدیمی و آزادسازی فضا
 
 📊 هر کاربر مجاز به ۲۰ درخواست روزانه است
     """
@@ -64,18 +69,15 @@ async def status_handler(client, message: Message):
     target = message.reply_to_message.from_user if message.reply_to_message else message.from_user
 
     # دریافت اطلاعات سطح دسترسی
-    perm = Permission.get_or_none(user_id=target.id)
-    status_level = ("مالک 👑" if target.id == OWNER_ID else
-                    "ادمین ⭐" if perm and perm.status == 2 else
-                    "ویژه ✨" if perm and perm.status == 1 else "عادی 👤")
+    level = await get_user_permission_async(target.id)
+    status_level = ("مالک 👑" if level == 3 else
+                    "ادمین ⭐" if level == 2 else
+                    "ویژه ✨" if level == 1 else "عادی 👤")
 
     # دریافت اطلاعات استفاده از Gemini
-    today = datetime.now().date()
-    gemini_usage = GeminiUsage.get_or_none((GeminiUsage.user_id == target.id)
-                                           & (GeminiUsage.date == today))
+    gemini_count = await gemini_quota.count(target.id)
 
-    remaining_requests = max(0,
-                             20 - (gemini_usage.count if gemini_usage else 0))
+    remaining_requests = max(0, gemini_quota.limit - gemini_count)
 
     # دریافت تعداد عکس‌های پروفایل
     try:
@@ -107,7 +109,7 @@ async def status_handler(client, message: Message):
 📅 <b>تاریخ امروز:</b> {persian_numbers.format_jalali(datetime.now())}
 
 🔮 <b>استفاده از Gemini:</b>
-├─ درخواست‌های امروز: {gemini_usage.count if gemini_usage else 0}
+├─ درخواست‌های امروز: {gemini_count}
 └─ باقیمانده: {remaining_requests}
 """
 
@@ -1,11 +1,19 @@
 # myapp.py
 # -*- coding: utf-8 -*-
 
-from pyrogram import Client, filters
+from pyrogram import Client, filters, idle
+import config
 from config import API_ID, API_HASH, BOT_TOKEN
 from database.models import create_tables
-from handlers import admin, gemini, google, info, public
-from handlers.gemini import gemini_bot
+from database.migrations import run_migrations
+from handlers import admin, gemini, google, history, info, public
+from handlers.gemini import (gemini_bot, stream_gemini_response,
+                             cache_enabled, GEMINI_STREAMING,
+                             GEMINI_MAX_CONCURRENCY, GEMINI_QUEUE_LIMIT)
+from utils.cache import TieredCache
+from utils.helpers import split_long_text
+from utils.streaming import INTERRUPTED_NOTE
+from utils.lifecycle import run_startup, run_shutdown
 import logging
 from pyrogram.types import (
     Message,
@@ -15,22 +23,43 @@ from pyrogram.types import (
     InlineQuery,
     InlineQueryResultArticle,
     InputTextMessageContent,
+    ChosenInlineResult,
 )
 from pyrogram.handlers import MessageHandler, InlineQueryHandler, CallbackQueryHandler
 from pyrogram.enums import ParseMode
 import re
 
-inline_queries = {}
+# متن کوئری‌های اینلاین برای دکمه «نمایش پاسخ» (محدود و منقضی‌شونده)؛
+# فقط کوئری‌های انتخاب‌شده در دیتابیس ماندگار می‌شوند
+inline_queries = TieredCache(
+    "inline_queries",
+    maxsize=getattr(config, "INLINE_QUERY_CACHE_SIZE", 5000),
+    ttl=getattr(config, "INLINE_QUERY_CACHE_TTL", 7 * 24 * 3600),
+    persistent=getattr(config, "INLINE_QUERY_PERSISTENT", True))
+
+# تعداد workerهای پایروگرام؛ بیشتر از ظرفیت Gemini تا دستورهای سریع معطل نمانند
+BOT_WORKERS = getattr(config, "BOT_WORKERS", None) or (
+    GEMINI_MAX_CONCURRENCY + GEMINI_QUEUE_LIMIT + 8)
+
+# پاسخ‌های تقسیم‌شده برای صفحه‌بندی «ادامه پاسخ» بدون فراخوانی مجدد مدل
+answer_store = TieredCache(
+    "answers",
+    maxsize=getattr(config, "ANSWER_CACHE_SIZE", 512),
+    ttl=getattr(config, "ANSWER_CACHE_TTL", 6 * 3600),
+    persistent=getattr(config, "ANSWER_CACHE_PERSISTENT", False))
 
 # تنظیمات لاگ‌گیری
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
+# لاگ درخواست‌های httpx شامل کلید API در آدرس است
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 
 def register_handlers(app: Client) -> None:
     """ثبت تمام هندلرهای ربات"""
+    history.register_history_handlers(app)
     admin.register_admin_handlers(app)
     gemini.register_gemini_handlers(app)
     google.register_google_handlers(app)
@@ -72,11 +101,14 @@ def register_handlers(app: Client) -> None:
         if not inline_query.query:
             return
 
-        # ذخیره کوئری برای استفاده بعدی
-        inline_queries[inline_query.id] = inline_query.query
+        # هر تغییر در متن یک کوئری جدید است؛ فقط در حافظه نگهداری می‌شود
+        await inline_queries.set(inline_query.id,
+                                 inline_query.query.strip(),
+                                 persist=False)
 
         results = [
             InlineQueryResultArticle(
+                id=inline_query.id,
                 title=f"پرسش: {inline_query.query[:30]}...",
                 input_message_content=InputTextMessageContent(
                     f"❓ سوال: {inline_query.query}"),
@@ -90,13 +122,19 @@ def register_handlers(app: Client) -> None:
 
         await inline_query.answer(results, cache_time=1)
 
+    @app.on_chosen_inline_result()
+    async def save_chosen_inline_result(client: Client,
+                                        chosen: ChosenInlineResult):
+        """ماندگار کردن کوئری انتخاب‌شده (نیازمند فعال بودن inline feedback)"""
+        await inline_queries.set(chosen.result_id, chosen.query.strip())
+
     @app.on_callback_query(filters.regex("^show_answer:"))
     async def show_inline_answer(client: Client,
                                  callback_query: CallbackQuery):
         """نمایش پاسخ به کوئری اینلاین"""
         try:
             query_id = callback_query.data.split(":")[1]
-            question = inline_queries.get(query_id)
+            question = await inline_queries.get(query_id)
 
             if not question:
                 await callback_query.answer("⚠️ سوال یافت نشد!",
@@ -104,6 +142,8 @@ def register_handlers(app: Client) -> None:
                 return
 
             await callback_query.answer("در حال پردازش پاسخ...")
+            # اگر inline feedback غیرفعال باشد کوئری اینجا ماندگار می‌شود
+            await inline_queries.set(query_id, question)
 
             # بررسی وجود پیام اصلی
             if not callback_query.message:
@@ -116,19 +156,40 @@ def register_handlers(app: Client) -> None:
                     "🌌 در حال پردازش سوال شما...")
 
             try:
-                response = await gemini_bot.generate_response(question)
+                interrupted = False
+                if GEMINI_STREAMING:
+                    # پاسخ‌های طولانی به جای پیام جدید با دکمه «ادامه پاسخ» صفحه‌بندی می‌شوند
+                    streamer = await stream_gemini_response(
+                        processing_msg,
+                        question,
+                        header="💎 <b>پاسخ به سوال شما:</b>\n\n",
+                        rollover=False,
+                        cache=cache_enabled("inline"))
+                    response = streamer.text
+                    interrupted = streamer.interrupted
+                else:
+                    response = await gemini_bot.generate_response(
+                        question, cache=cache_enabled("inline"))
                 if not response:
                     await processing_msg.edit_text("⚠️ خطا در پردازش سوال")
                     return
 
+                if interrupted:
+                    # پاسخ ناقص برای «ادامه پاسخ» ذخیره نمی‌شود
+                    if len(response) > 3900:
+                        response = split_long_text(
+                            response, 3900 - len(INTERRUPTED_NOTE)
+                        )[0] + INTERRUPTED_NOTE
+                    await processing_msg.edit_text(
+                        f"💎 <b>پاسخ به سوال شما:</b>\n\n{response}",
+                        parse_mode=ParseMode.HTML)
+                    return
+
                 # تقسیم پاسخ اگر طولانی باشد
                 if len(response) > 3900:
-                    chunks = [
-                        response[i:i + 3900]
-                        for i in range(0, len(response), 3900)
-                    ]
+                    chunks = split_long_text(response, 3900)
                     first_part = chunks[0]
-                    remaining = "\n\n".join(chunks[1:])
+                    await answer_store.set(query_id, chunks)
 
                     await processing_msg.edit_text(
                         f"💎 <b>پاسخ به سوال شما:</b>\n\n{first_part}",
@@ -157,16 +218,27 @@ def register_handlers(app: Client) -> None:
         """نمایش ادامه پاسخ طولانی"""
         _, query_id, chunk_idx = callback_query.data.split(":")
         chunk_idx = int(chunk_idx)
-        question = inline_queries.get(query_id)
-
-        if not question:
-            await callback_query.answer("⚠️ سوال یافت نشد!", show_alert=True)
-            return
+        chunks = await answer_store.get(query_id)
 
-        await callback_query.answer("در حال پردازش...")
+        if not chunks:
+            # پاسخ در کش نیست (منقضی شده)؛ یک بار تولید و ذخیره می‌شود
+            question = await inline_queries.get(query_id)
+            if not question:
+                await callback_query.answer("⚠️ سوال یافت نشد!",
+                                            show_alert=True)
+                return
 
-        response = await gemini_bot.generate_response(question)
-        chunks = [response[i:i + 3900] for i in range(0, len(response), 3900)]
+            await callback_query.answer("در حال پردازش...")
+            response = await gemini_bot.generate_response(
+                question, cache=cache_enabled("inline"))
+            if not response:
+                await callback_query.message.edit_text(
+                    "⚠️ خطا در پردازش پاسخ")
+                return
+            chunks = split_long_text(response, 3900)
+            await answer_store.set(query_id, chunks)
+        elif chunk_idx < len(chunks):
+            await callback_query.answer()
 
         if chunk_idx >= len(chunks):
             await callback_query.answer("✅ به انتهای پاسخ رسیدید",
@@ -207,12 +279,25 @@ def register_handlers(app: Client) -> None:
     #     await message.reply("⚠️ دستور نامعتبر! برای مشاهده راهنما از /help استفاده کنید.")
 
 
+async def serve(app: Client) -> None:
+    """اجرای ربات همراه با کارهای شروع و خاموشی"""
+    await app.start()
+    try:
+        await run_startup()
+        logger.info("Bot started")
+        await idle()
+    finally:
+        await run_shutdown()
+        await app.stop()
+
+
 def main():
     """تابع اصلی اجرای ربات"""
     try:
-        # ایجاد جداول دیتابیس
+        # مهاجرت ساختار دیتابیس‌های موجود و ایجاد جداول جدید
+        version = run_migrations()
         create_tables()
-        logger.info("Database tables created/verified")
+        logger.info(f"Database tables created/verified (schema {version})")
 
         # تنظیمات کلاینت Pyrogram
         app = Client(
@@ -220,15 +305,23 @@ def main():
             api_id=API_ID,
             api_hash=API_HASH,
             bot_token=BOT_TOKEN,
+            workers=BOT_WORKERS,
         )
 
         # ثبت هندلرها
         register_handlers(app)
         logger.info("All handlers registered")
+        if inline_queries.persistent:
+            # بدون inline feedback کوئری فقط با اولین کلیک روی دکمه ماندگار می‌شود
+            logger.warning(
+                "Inline queries are persisted only when a result is chosen "
+                "(needs /setinlinefeedback in BotFather) or its \"show answer\" "
+                "button is pressed; unpressed buttons won't survive a restart "
+                "without inline feedback")
 
         # راه‌اندازی ربات
         logger.info("Starting bot...")
-        app.run()
+        app.run(serve(app))
 
     except Exception as e:
         logger.critical(f"Failed to start bot: {str(e)}")
@@ -0,0 +1,152 @@
+# utils\cache.py
+import datetime
+import json
+import logging
+from typing import Any, Optional
+from cachetools import TTLCache
+from database.models import CacheEntry
+from database.utils import run_db
+
+logger = logging.getLogger(__name__)
+
+# همه کش‌های ساخته شده برای گزارش آمار
+cache_registry: list["TieredCache"] = []
+
+
+class CacheStats:
+    """شمارنده‌های عملکرد کش"""
+    __slots__ = ("hits", "misses", "evictions")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def as_dict(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+class LRUTTLCache(TTLCache):
+    """کش LRU با انقضای زمانی که تعداد حذف‌ها را می‌شمارد"""
+
+    def __init__(self, maxsize: int, ttl: float, stats: CacheStats):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.stats = stats
+
+    def popitem(self):
+        item = super().popitem()
+        self.stats.evictions += 1
+        return item
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        self.stats.evictions += len(expired)
+        return expired
+
+
+class TieredCache:
+    """
+    کش دو لایه:
+        1. حافظه (LRU با TTL)
+        2. جدول SQLite (اختیاری) برای ماندگاری پس از ری‌استارت
+
+    مقادیر باید قابل تبدیل به JSON باشند.
+    """
+
+    def __init__(self,
+                 namespace: str,
+                 maxsize: int = 1024,
+                 ttl: float = 3600,
+                 persistent: bool = False):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.persistent = persistent
+        self.stats = CacheStats()
+        self._memory = LRUTTLCache(maxsize, ttl, self.stats)
+        cache_registry.append(self)
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        """دریافت مقدار از کش (ابتدا حافظه سپس دیتابیس)"""
+        value = self._memory.get(key)
+        if value is None and self.persistent:
+            value = await run_db(self._load, key)
+            if value is not None:
+                self._memory[key] = value
+
+        if value is None:
+            self.stats.misses += 1
+            return default
+
+        self.stats.hits += 1
+        return value
+
+    async def set(self, key: str, value: Any, persist: bool = True) -> None:
+        """
+        ذخیره مقدار در کش
+
+        Args:
+            persist: اگر False باشد فقط در حافظه ذخیره می‌شود (بدون نوشتن در دیتابیس)
+        """
+        self._memory[key] = value
+        if self.persistent and persist:
+            await run_db(self._store, key, value)
+
+    async def delete(self, key: str) -> None:
+        """حذف مقدار از همه لایه‌ها"""
+        self._memory.pop(key, None)
+        if self.persistent:
+            await run_db(
+                CacheEntry.delete().where(
+                    (CacheEntry.namespace == self.namespace)
+                    & (CacheEntry.key == key)).execute)
+
+    async def purge_expired(self) -> int:
+        """حذف رکوردهای منقضی شده از لایه دیتابیس"""
+        self._memory.expire()
+        if not self.persistent:
+            return 0
+        return await run_db(
+            CacheEntry.delete().where(
+                (CacheEntry.namespace == self.namespace)
+                & (CacheEntry.expires_at <= datetime.datetime.now())).execute)
+
+    def info(self) -> dict:
+        """آمار کش برای نمایش به مدیران"""
+        return {
+            'namespace': self.namespace,
+            'size': len(self._memory),
+            'maxsize': self._memory.maxsize,
+            **self.stats.as_dict()
+        }
+
+    def _load(self, key: str) -> Optional[Any]:
+        try:
+            entry = CacheEntry.get_or_none(
+                (CacheEntry.namespace == self.namespace)
+                & (CacheEntry.key == key)
+                & (CacheEntry.expires_at > datetime.datetime.now()))
+            return json.loads(entry.value) if entry else None
+        except Exception as e:
+            logger.error(f"Cache load error ({self.namespace}): {str(e)}")
+            return None
+
+    def _store(self, key: str, value: Any) -> None:
+        expires_at = datetime.datetime.now() + datetime.timedelta(
+            seconds=self.ttl)
+        try:
+            CacheEntry.insert(namespace=self.namespace,
+                              key=key,
+                              value=json.dumps(value, ensure_ascii=False),
+                              expires_at=expires_at).on_conflict(
+                                  conflict_target=[
+                                      CacheEntry.namespace, CacheEntry.key
+                                  ],
+                                  preserve=[
+                                      CacheEntry.value, CacheEntry.expires_at
+                                  ]).execute()
+        except Exception as e:
+            logger.error(f"Cache store error ({self.namespace}): {str(e)}")
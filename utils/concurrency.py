@@ -0,0 +1,125 @@
+# utils\concurrency.py
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class StreamFanout:
+    """پخش تکه‌های یک جریان برای چند مصرف‌کننده هم‌زمان"""
+
+    def __init__(self):
+        self.pieces: list[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, piece: str) -> None:
+        async with self._changed:
+            self.pieces.append(piece)
+            self._changed.notify_all()
+
+    async def close(self, error: Optional[BaseException] = None) -> None:
+        async with self._changed:
+            self.error = error
+            self.done = True
+            self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """
+        دریافت همه تکه‌ها از ابتدا تا پایان جریان
+
+        اگر جریان با خطا تمام شده باشد، بعد از آخرین تکه همان خطا رخ می‌دهد.
+        """
+        index = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(
+                    lambda: len(self.pieces) > index or self.done)
+                pieces = self.pieces[index:]
+                finished = self.done
+            for piece in pieces:
+                yield piece
+            index += len(pieces)
+            if finished and index >= len(self.pieces):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class SingleFlight:
+    """
+    ادغام درخواست‌های هم‌زمان با کلید یکسان
+
+    اولین فراخوانی کار اصلی را در یک تسک جداگانه اجرا می‌کند و بقیه منتظر
+    همان نتیجه می‌مانند؛ لغو شدن یکی از منتظرها کار مشترک را لغو نمی‌کند.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Task] = {}
+        self._streams: dict[str, StreamFanout] = {}
+        # نگهداری ارجاع به تسک‌های پخش تا توسط GC جمع‌آوری نشوند
+        self._pumps: dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        """اجرای func فقط یک بار برای همه درخواست‌های هم‌زمان با این کلید"""
+        task = self._calls.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finish_call(key, t))
+        else:
+            self.coalesced += 1
+            logger.debug(f"Coalesced in-flight call {key[:12]}")
+        return await asyncio.shield(task)
+
+    async def stream(self, key: str,
+                     func: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """نسخه جریانی do: همه درخواست‌های هم‌زمان تکه‌های یک جریان را می‌گیرند"""
+        fanout = self._streams.get(key)
+        if fanout is None:
+            self.calls += 1
+            fanout = StreamFanout()
+            self._streams[key] = fanout
+            self._pumps[key] = asyncio.ensure_future(
+                self._pump(key, fanout, func))
+        else:
+            self.coalesced += 1
+            logger.debug(f"Coalesced in-flight stream {key[:12]}")
+
+        async for piece in fanout.subscribe():
+            yield piece
+
+    def stats(self) -> dict:
+        return {
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'in_flight': len(self._calls) + len(self._streams)
+        }
+
+    async def _pump(self, key: str, fanout: StreamFanout,
+                    func: Callable[[], AsyncIterator[str]]) -> None:
+        error = None
+        try:
+            async for piece in func():
+                await fanout.publish(piece)
+        except Exception as e:
+            logger.error(f"Shared stream error: {str(e)}")
+            error = e
+        finally:
+            self._streams.pop(key, None)
+            self._pumps.pop(key, None)
+            await fanout.close(error)
+
+    def _finish_call(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # جلوگیری از هشدار «exception was never retrieved» وقتی منتظری نمانده
+        if not task.cancelled():
+            task.exception()
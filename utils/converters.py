@@ -15,6 +15,34 @@ class PersianNumbersConverter:
         return ''.join(numbers.get(c, c) for c in text)
 
 
+class PersianTextNormalizer:
+    """یکسان‌سازی متن فارسی/عربی برای مقایسه، کلید کش و جستجو"""
+    CHAR_MAP = str.maketrans({
+        'ي': 'ی', 'ى': 'ی', 'ئ': 'ی', 'ك': 'ک', 'ة': 'ه', 'ۀ': 'ه',
+        'أ': 'ا', 'إ': 'ا', 'ٱ': 'ا', 'آ': 'ا', 'ؤ': 'و',
+        '۰': '0', '۱': '1', '۲': '2', '۳': '3', '۴': '4',
+        '۵': '5', '۶': '6', '۷': '7', '۸': '8', '۹': '9',
+        '٠': '0', '١': '1', '٢': '2', '٣': '3', '٤': '4',
+        '٥': '5', '٦': '6', '٧': '7', '٨': '8', '٩': '9',
+        '\u200c': ' ', '\u200f': None, '\u200e': None, 'ـ': None
+    })
+    DIACRITICS = re.compile(r'[\u064B-\u065F\u0670]')
+    WHITESPACE = re.compile(r'\s+')
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        نرمال‌سازی متن:
+        - تبدیل حروف عربی به فارسی (ي/ی، ك/ک و ...)
+        - تبدیل اعداد فارسی و عربی به انگلیسی
+        - حذف اعراب، کشیده و نیم‌فاصله
+        - یکسان‌سازی فاصله‌ها و حروف کوچک
+        """
+        text = PersianTextNormalizer.DIACRITICS.sub('', text or '')
+        text = text.translate(PersianTextNormalizer.CHAR_MAP)
+        return PersianTextNormalizer.WHITESPACE.sub(' ', text).strip().casefold()
+
+
 class persian_numbers:
     @staticmethod
     def to_jalali(dt: Union[datetime.datetime, datetime.date, str, Tuple[int, int, int]]) -> str:
@@ -1,15 +1,20 @@
 # -*- coding: utf-8 -*-
 from functools import wraps
 from pyrogram import filters
-from pyrogram.types import Message
+from pyrogram.types import Message, CallbackQuery
 from typing import Callable, Optional
-from database.models import BotStatus, Permission
-from database.utils import get_user_permission
+from database.utils import get_user_permission_async, bot_state
+from utils.quota import request_user
+from utils.ratelimit import get_limiter, retry_after_seconds
+import config
 from config import OWNER_ID
 import logging
 
 logger = logging.getLogger(__name__)
 
+# کاربران با این سطح دسترسی یا بالاتر (پیش‌فرض: ادمین) محدودیت درخواست ندارند
+RATE_LIMIT_EXEMPT_LEVEL = getattr(config, "RATE_LIMIT_EXEMPT_LEVEL", 2)
+
 
 def register_command(
         commands: str | list,
@@ -30,14 +35,18 @@ def register_command(
         @wraps(func)
         async def wrapper(client, message: Message, *args, **kwargs):
             # بررسی فعال بودن ربات (مگر برای دستورات حیاتی)
-            if not critical and not BotStatus.get_or_create(id=1)[0].is_active:
+            if not critical and not bot_state.is_active:
                 return
 
+            # کاربر درخواست برای اولویت‌دهی در بودجه سرویس‌ها
+            token = request_user.set(getattr(message.from_user, "id", None))
             try:
                 return await func(client, message, *args, **kwargs)
             except Exception as e:
                 logger.error(f"Error in {func.__name__}: {str(e)}")
                 await message.reply("⚠️ خطایی در پردازش دستور رخ داد")
+            finally:
+                request_user.reset(token)
 
         # ثبت خودکار هندلر
         wrapper.handler = filters.command(commands=commands,
@@ -70,7 +79,7 @@ def require_permission(level: int = 0):
             if user_id == OWNER_ID:
                 return await func(client, message, *args, **kwargs)
 
-            permission = get_user_permission(user_id)
+            permission = await get_user_permission_async(user_id)
 
             if permission < level:
                 await message.reply("⛔ شما دسترسی لازم برای این کار را ندارید!"
@@ -84,37 +93,43 @@ def require_permission(level: int = 0):
     return decorator
 
 
-def rate_limit(limit: int = 3, interval: int = 10):
+def rate_limit(limit: int = 3,
+               interval: int = 10,
+               bucket: Optional[str] = None,
+               algorithm: str = "window",
+               exempt_level: int = RATE_LIMIT_EXEMPT_LEVEL):
     """
     دکوراتور برای محدود کردن تعداد درخواست‌ها
-    """
-    from collections import defaultdict
-    import time
 
-    user_timestamps = defaultdict(list)
+    Parameters:
+        bucket: نام سهمیه مشترک (مثلاً "gemini")؛ دستورها و دکمه‌هایی با نام یکسان
+            یک سهمیه دارند. پیش‌فرض سهمیه جداگانه برای هر دستور است.
+        algorithm: "window" (پنجره لغزان) یا "token" (سطل توکن)
+        exempt_level: کاربران با این سطح دسترسی یا بالاتر محدود نمی‌شوند
+    """
 
     def decorator(func: Callable):
-
+        limiter = get_limiter(bucket or f"{func.__module__}.{func.__qualname__}",
+                              limit, interval, algorithm)
+
         @wraps(func)
         async def wrapper(client, message: Message, *args, **kwargs):
             user_id = message.from_user.id
-            now = time.time()
-
-            # حذف درخواست‌های قدیمی
-            user_timestamps[user_id] = [
-                t for t in user_timestamps[user_id] if now - t < interval
-            ]
-
-            if len(user_timestamps[user_id]) >= limit:
-                await message.reply(
-                    f"⏳ لطفاً {interval} ثانیه صبر کنید قبل از ارسال درخواست جدید"
-                )
+            delay = limiter.hit(user_id)
+            # سطح دسترسی فقط برای درخواست‌های محدودشده بررسی می‌شود
+            if delay and await get_user_permission_async(
+                    user_id) < exempt_level:
+                text = f"⏳ لطفاً {retry_after_seconds(delay)} ثانیه صبر کنید قبل از ارسال درخواست جدید"
+                # برای دکمه‌ها (callback) پیام به صورت هشدار نمایش داده می‌شود
+                if isinstance(message, CallbackQuery):
+                    await message.answer(text, show_alert=True)
+                else:
+                    await message.reply(text)
                 return
 
-            user_timestamps[user_id].append(now)
             return await func(client, message, *args, **kwargs)
-
-        return wrapper
+
+        return wrapper
 
     return decorator
 
@@ -129,9 +144,27 @@ def only_owner(func: Callable):
     return require_permission(level=3)(func)
 
 
+def active_only(func: Callable):
+    """
+    دکوراتور بررسی روشن بودن ربات برای هندلرهای بدون register_command (مثل دکمه‌ها)
+    """
+
+    @wraps(func)
+    async def wrapper(client, update, *args, **kwargs):
+        if not bot_state.is_active:
+            if isinstance(update, CallbackQuery):
+                await update.answer()
+            return
+        return await func(client, update, *args, **kwargs)
+
+    return wrapper
+
+
 def database_required(func: Callable):
     """
     دکوراتور برای اطمینان از اتصال به دیتابیس
+
+    اتصال بعد از اجرا بسته نمی‌شود تا کوئری‌های بعدی همان نخ از آن استفاده کنند.
     """
 
     @wraps(func)
@@ -139,14 +172,10 @@ def database_required(func: Callable):
         from database.models import db
 
         try:
-            if db.is_closed():
-                db.connect()
+            db.connect(reuse_if_open=True)
             return await func(client, message, *args, **kwargs)
         except Exception as e:
             logger.error(f"Database error: {str(e)}")
-            await message.reply("⚠️ خطایی در ارتباط با دیتابیس رخ داد")
-        finally:
-            if not db.is_closed():
-                db.close()
+            await message.reply("⚠️ خطایی در ارتباط با دیتابیس رخ داد")
 
     return wrapper
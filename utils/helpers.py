@@ -30,3 +30,29 @@ def extract_user_info(message: Message) -> dict:
 def split_long_text(text: str, max_length: int = 4000) -> list[str]:
     """تقسیم متن طولانی به بخش‌های کوچکتر"""
     return [text[i:i+max_length] for i in range(0, len(text), max_length)]
+
+
+def find_split_point(text: str, max_length: int) -> int:
+    """یافتن بهترین نقطه برش (پاراگراف، خط، جمله یا کلمه) تا حداکثر طول"""
+    if len(text) <= max_length:
+        return len(text)
+
+    window = text[:max_length]
+    for separator in ("\n\n", "\n", ". ", "؟ ", "? ", "! ", "، ", " "):
+        idx = window.rfind(separator)
+        # برش خیلی زود باعث تکه‌های کوچک و زیاد می‌شود
+        if idx >= max_length // 2:
+            return idx + len(separator)
+    return max_length
+
+
+def split_on_boundaries(text: str, max_length: int = 4000) -> list[str]:
+    """تقسیم متن طولانی بدون شکستن جمله‌ها و کلمات"""
+    parts = []
+    while text:
+        cut = find_split_point(text, max_length)
+        part = text[:cut].strip()
+        if part:
+            parts.append(part)
+        text = text[cut:]
+    return parts
@@ -0,0 +1,210 @@
+# utils\history.py
+import asyncio
+import datetime
+import logging
+from typing import Optional
+from cachetools import LRUCache
+from pyrogram.types import Message
+from database.models import db, User, Message as StoredMessage
+from database.utils import run_db
+from utils.lifecycle import on_startup, on_shutdown
+from utils.converters import PersianTextNormalizer
+from peewee import chunked
+import config
+
+logger = logging.getLogger(__name__)
+
+# ثبت تاریخچه پیام‌ها و اندازه صف، دسته و فاصله نوشتن (ثانیه)
+HISTORY_ENABLED = getattr(config, "HISTORY_ENABLED", True)
+HISTORY_QUEUE_SIZE = getattr(config, "HISTORY_QUEUE_SIZE", 10000)
+HISTORY_BATCH_SIZE = getattr(config, "HISTORY_BATCH_SIZE", 500)
+HISTORY_FLUSH_INTERVAL = getattr(config, "HISTORY_FLUSH_INTERVAL", 2)
+
+
+class MessageRecorder:
+    """
+    ثبت پیام‌ها و مشخصات کاربران در پس‌زمینه
+
+    هندلر فقط پیام را در صف محدود می‌گذارد (بدون انتظار)؛ نویسنده پس‌زمینه
+    پیام‌ها را دسته‌ای و در یک تراکنش می‌نویسد. مشخصات کاربر فقط وقتی نوشته
+    می‌شود که نام یا یوزرنیم تغییر کرده باشد. اگر صف پر باشد پیام‌های جدید
+    کنار گذاشته و شمرده می‌شوند.
+    """
+
+    def __init__(self,
+                 max_queue: int = HISTORY_QUEUE_SIZE,
+                 batch_size: int = HISTORY_BATCH_SIZE,
+                 interval: float = HISTORY_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        # آخرین مشخصات نوشته‌شده هر کاربر
+        self._profiles: LRUCache = LRUCache(maxsize=50000)
+        self._task: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.dropped = 0
+
+    def capture(self, message: Message) -> None:
+        """افزودن پیام به صف ثبت (بدون مسدود کردن)"""
+        user = message.from_user
+        text = message.text or message.caption
+        row = {
+            'chat_id': message.chat.id,
+            'message_id': message.id,
+            'from_user': user.id if user else None,
+            'text': text,
+            'search_text':
+            PersianTextNormalizer.normalize(text) if text else None,
+            'date': message.date or datetime.datetime.now(),
+            'is_bot': bool(user and user.is_bot),
+            'reply_to_message_id': message.reply_to_message_id
+        }
+        profile = ((user.id, user.first_name, user.last_name, user.username)
+                   if user else None)
+        try:
+            self._queue.put_nowait((row, profile))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(
+                    f"History queue full, {self.dropped} messages dropped")
+
+    def stats(self) -> dict:
+        return {
+            'queued': self._queue.qsize(),
+            'recorded': self.recorded,
+            'dropped': self.dropped
+        }
+
+    async def start(self) -> None:
+        self._task = asyncio.ensure_future(self._writer())
+
+    async def stop(self) -> None:
+        """توقف نویسنده و نوشتن باقی‌مانده صف"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while not self._queue.empty():
+            await self._write(self._drain())
+
+    async def _writer(self) -> None:
+        while True:
+            first = await self._queue.get()
+            # فرصت برای جمع شدن دسته، مگر اینکه صف از قبل پر باشد
+            if self._queue.qsize() < self.batch_size:
+                await asyncio.sleep(self.interval)
+            try:
+                await self._write([first] + self._drain(self.batch_size - 1))
+            except Exception as e:
+                logger.error(f"History write failed: {str(e)}")
+
+    def _drain(self, limit: Optional[int] = None) -> list:
+        items = []
+        while not self._queue.empty() and (limit is None
+                                           or len(items) < limit):
+            items.append(self._queue.get_nowait())
+        return items
+
+    async def _write(self, items: list) -> None:
+        if not items:
+            return
+        profiles = {}
+        for _, profile in items:
+            if profile and self._profiles.get(profile[0]) != profile:
+                profiles[profile[0]] = profile
+        rows = [row for row, _ in items]
+
+        await run_db(self._store, rows, list(profiles.values()))
+        for user_id, profile in profiles.items():
+            self._profiles[user_id] = profile
+        self.recorded += len(rows)
+
+    @staticmethod
+    def _store(rows: list[dict], profiles: list[tuple]) -> None:
+        with db.atomic():
+            for batch in chunked(profiles, 200):
+                User.insert_many(
+                    batch,
+                    fields=[
+                        User.id, User.first_name, User.last_name,
+                        User.username
+                    ]).on_conflict(conflict_target=[User.id],
+                                   preserve=[
+                                       User.first_name, User.last_name,
+                                       User.username
+                                   ]).execute()
+            for batch in chunked(rows, 100):
+                # پیام‌های تکراری (مثلاً پیام ویرایش‌شده) نادیده گرفته می‌شوند
+                StoredMessage.insert_many(batch).on_conflict_ignore().execute()
+
+
+def fts_query(query: str) -> Optional[str]:
+    """
+    تبدیل عبارت کاربر به کوئری FTS5
+
+    هر کلمه نرمال‌شده داخل گیومه قرار می‌گیرد تا علائم خاص FTS تفسیر نشوند؛
+    همه کلمات باید در پیام باشند.
+    """
+    words = PersianTextNormalizer.normalize(query).split()
+    return " ".join('"{}"'.format(word.replace('"', '""')) for word in words) or None
+
+
+def search_history(query: str,
+                   page: int = 1,
+                   page_size: int = 5,
+                   since: Optional[datetime.date] = None,
+                   until: Optional[datetime.date] = None,
+                   chat_id: Optional[int] = None
+                   ) -> tuple[list[dict], bool]:
+    """
+    جستجوی رتبه‌بندی‌شده (bm25) در تاریخچه پیام‌ها
+
+    Args:
+        chat_id: محدود کردن نتایج به یک چت (None یعنی همه چت‌ها)
+
+    Returns:
+        (نتایج صفحه, وجود صفحه بعد)
+    """
+    match = fts_query(query)
+    if not match:
+        return [], False
+
+    conditions = ["message_fts MATCH ?"]
+    params: list = [match]
+    if chat_id is not None:
+        conditions.append("m.chat_id = ?")
+        params.append(chat_id)
+    if since:
+        conditions.append("m.date >= ?")
+        params.append(str(datetime.datetime.combine(since,
+                                                    datetime.time.min)))
+    if until:
+        conditions.append("m.date < ?")
+        params.append(
+            str(datetime.datetime.combine(until + datetime.timedelta(days=1),
+                                          datetime.time.min)))
+    params += [page_size + 1, (page - 1) * page_size]
+
+    cursor = db.execute_sql(
+        f"""
+        SELECT m.chat_id, m.message_id, m.text, m.date, m.from_user_id,
+               u.first_name, u.username
+        FROM message_fts
+        JOIN message m ON m.id = message_fts.rowid
+        LEFT JOIN user u ON u.id = m.from_user_id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY message_fts.rank
+        LIMIT ? OFFSET ?""", params)
+    columns = [column[0] for column in cursor.description]
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    return rows[:page_size], len(rows) > page_size
+
+
+message_recorder = MessageRecorder()
+if HISTORY_ENABLED:
+    on_startup(message_recorder.start)
+    on_shutdown(message_recorder.stop)
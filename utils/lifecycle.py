@@ -0,0 +1,69 @@
+# utils\lifecycle.py
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+_startup_hooks: list[Callable[[], Awaitable]] = []
+_shutdown_hooks: list[Callable[[], Awaitable]] = []
+
+
+def on_startup(func: Callable[[], Awaitable]):
+    """ثبت تابعی که بعد از اتصال ربات اجرا می‌شود (مثل شروع کارهای پس‌زمینه)"""
+    _startup_hooks.append(func)
+    return func
+
+
+def on_shutdown(func: Callable[[], Awaitable]):
+    """ثبت تابعی که هنگام خاموش شدن ربات اجرا می‌شود (مثل بستن اتصال‌ها)"""
+    _shutdown_hooks.append(func)
+    return func
+
+
+def run_periodically(interval: float, func: Callable[[], Awaitable]):
+    """
+    اجرای دوره‌ای یک تابع در پس‌زمینه از شروع تا خاموشی ربات
+
+    خطای یک اجرا فقط لاگ می‌شود و اجرای بعدی را متوقف نمی‌کند.
+    """
+    tasks: list[asyncio.Task] = []
+
+    async def loop():
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await func()
+            except Exception as e:
+                logger.error(f"Periodic task {func.__name__} failed: {str(e)}")
+
+    async def start():
+        tasks.append(asyncio.ensure_future(loop()))
+
+    async def stop():
+        while tasks:
+            task = tasks.pop()
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    on_startup(start)
+    on_shutdown(stop)
+    return func
+
+
+async def run_startup():
+    """اجرای توابع شروع به ترتیب ثبت"""
+    for func in _startup_hooks:
+        await func()
+
+
+async def run_shutdown():
+    """اجرای توابع خاموشی به ترتیب معکوس؛ خطای یکی مانع بقیه نمی‌شود"""
+    for func in reversed(_shutdown_hooks):
+        try:
+            await func()
+        except Exception as e:
+            logger.error(f"Shutdown hook {func.__name__} failed: {str(e)}")
@@ -0,0 +1,148 @@
+# utils\quota.py
+import datetime
+import logging
+from contextvars import ContextVar
+from typing import Optional
+from database.models import ApiUsage
+from database.utils import get_user_permission_async, run_db
+from utils.lifecycle import on_startup
+import config
+
+logger = logging.getLogger(__name__)
+
+# بودجه روزانه هر سرویس (تعداد فراخوانی و توکن؛ None یعنی نامحدود)
+GOOGLE_DAILY_LIMIT = getattr(config, "GOOGLE_DAILY_LIMIT", 100)
+GEMINI_DAILY_LIMIT = getattr(config, "GEMINI_DAILY_LIMIT", 1500)
+GEMINI_DAILY_TOKEN_LIMIT = getattr(config, "GEMINI_DAILY_TOKEN_LIMIT", None)
+# از این نسبت بودجه به بعد فقط کاربران با سطح API_PRIORITY_LEVEL یا بالاتر
+# فراخوانی جدید دارند و بقیه فقط از کش پاسخ می‌گیرند
+API_SOFT_LIMIT_RATIO = getattr(config, "API_SOFT_LIMIT_RATIO", 0.8)
+API_PRIORITY_LEVEL = getattr(config, "API_PRIORITY_LEVEL", 2)
+
+# کاربری که درخواست فعلی برای او انجام می‌شود (برای تعیین اولویت)
+request_user: ContextVar[Optional[int]] = ContextVar("request_user",
+                                                     default=None)
+
+
+class QuotaLedger:
+    """
+    دفتر مصرف روزانه سرویس‌های خارجی (فراخوانی و توکن به تفکیک روز)
+
+    وضعیت هر سرویس:
+        ok: زیر بودجه نرم
+        soft: بین بودجه نرم و سخت؛ فقط کاربران پراولویت
+        hard: بودجه تمام شده؛ هیچ فراخوانی جدیدی انجام نمی‌شود
+    """
+    OK = "ok"
+    SOFT = "soft"
+    HARD = "hard"
+
+    def __init__(self, soft_ratio: float = API_SOFT_LIMIT_RATIO):
+        self.soft_ratio = soft_ratio
+        self.budgets: dict[str, tuple[Optional[int], Optional[int]]] = {}
+        self.rejected: dict[str, int] = {}
+        self._day = datetime.date.today()
+        self._usage: dict[str, list[int]] = {}
+
+    def configure(self,
+                  api: str,
+                  calls: Optional[int] = None,
+                  tokens: Optional[int] = None) -> None:
+        """تعریف بودجه روزانه یک سرویس"""
+        self.budgets[api] = (calls, tokens)
+        self.rejected.setdefault(api, 0)
+
+    def usage(self, api: str) -> list[int]:
+        """[فراخوانی‌ها, توکن‌ها]ی امروز"""
+        today = datetime.date.today()
+        if today != self._day:
+            self._day = today
+            self._usage.clear()
+        return self._usage.setdefault(api, [0, 0])
+
+    async def load(self) -> None:
+        """خواندن مصرف امروز از دیتابیس (هنگام شروع ربات)"""
+        self._day = datetime.date.today()
+        rows = await run_db(self._load, self._day)
+        self._usage = {api: rows.get(api, [0, 0]) for api in self.budgets}
+
+    def state(self, api: str) -> str:
+        calls_limit, tokens_limit = self.budgets.get(api, (None, None))
+        calls, tokens = self.usage(api)
+        ratio = max(calls / calls_limit if calls_limit else 0,
+                    tokens / tokens_limit if tokens_limit else 0)
+        if ratio >= 1:
+            return self.HARD
+        if ratio >= self.soft_ratio:
+            return self.SOFT
+        return self.OK
+
+    async def allow(self, api: str) -> bool:
+        """آیا فراخوانی جدید برای کاربر درخواست فعلی مجاز است"""
+        state = self.state(api)
+        if state == self.OK:
+            return True
+        if state == self.SOFT:
+            user_id = request_user.get()
+            if (user_id and await get_user_permission_async(user_id)
+                    >= API_PRIORITY_LEVEL):
+                return True
+
+        self.rejected[api] = self.rejected.get(api, 0) + 1
+        logger.warning(f"{api} quota {state}, call rejected")
+        return False
+
+    async def record(self, api: str, calls: int = 1, tokens: int = 0) -> None:
+        """ثبت مصرف در حافظه و دیتابیس"""
+        usage = self.usage(api)
+        usage[0] += calls
+        usage[1] += tokens
+        try:
+            await run_db(self._store, api, self._day, calls, tokens)
+        except Exception as e:
+            logger.error(f"Quota ledger error ({api}): {str(e)}")
+
+    def report(self) -> list[dict]:
+        """مصرف امروز همه سرویس‌ها برای نمایش به مالک"""
+        report = []
+        for api, (calls_limit, tokens_limit) in self.budgets.items():
+            calls, tokens = self.usage(api)
+            report.append({
+                'api': api,
+                'calls': calls,
+                'calls_limit': calls_limit,
+                'tokens': tokens,
+                'tokens_limit': tokens_limit,
+                'state': self.state(api),
+                'rejected': self.rejected.get(api, 0)
+            })
+        return report
+
+    @staticmethod
+    def _load(day: datetime.date) -> dict[str, list[int]]:
+        try:
+            return {
+                row.api: [row.calls, row.tokens]
+                for row in ApiUsage.select().where(ApiUsage.date == day)
+            }
+        except Exception as e:
+            logger.error(f"Quota ledger load error: {str(e)}")
+            return {}
+
+    @staticmethod
+    def _store(api: str, day: datetime.date, calls: int, tokens: int) -> None:
+        ApiUsage.insert(api=api, date=day, calls=calls,
+                        tokens=tokens).on_conflict(
+                            conflict_target=[ApiUsage.api, ApiUsage.date],
+                            update={
+                                ApiUsage.calls: ApiUsage.calls + calls,
+                                ApiUsage.tokens: ApiUsage.tokens + tokens
+                            }).execute()
+
+
+api_quota = QuotaLedger()
+api_quota.configure("google", calls=GOOGLE_DAILY_LIMIT)
+api_quota.configure("gemini",
+                    calls=GEMINI_DAILY_LIMIT,
+                    tokens=GEMINI_DAILY_TOKEN_LIMIT)
+on_startup(api_quota.load)
@@ -0,0 +1,184 @@
+# utils\ratelimit.py
+import logging
+import math
+import time
+from typing import Hashable, Optional
+from utils.lifecycle import run_periodically
+import config
+
+logger = logging.getLogger(__name__)
+
+# فاصله حذف کلیدهای بی‌استفاده از حافظه (ثانیه)
+RATE_LIMIT_EVICT_INTERVAL = getattr(config, "RATE_LIMIT_EVICT_INTERVAL", 300)
+
+
+class WindowState:
+    """وضعیت یک کلید در پنجره لغزان: شمارنده پنجره فعلی و قبلی"""
+    __slots__ = ("window", "current", "previous")
+
+    def __init__(self, window: int):
+        self.window = window
+        self.current = 0
+        self.previous = 0
+
+
+class SlidingWindowLimiter:
+    """
+    محدودکننده پنجره لغزان تقریبی (sliding window counter)
+
+    تعداد درخواست‌های بازه اخیر از روی شمارنده پنجره فعلی و سهم وزنی
+    پنجره قبلی تخمین زده می‌شود؛ هر بررسی O(1) و حافظه هر کلید ثابت است.
+    """
+
+    def __init__(self, limit: int, interval: float):
+        self.limit = limit
+        self.interval = interval
+        self._keys: dict[Hashable, WindowState] = {}
+
+    def hit(self, key: Hashable, now: Optional[float] = None) -> float:
+        """
+        ثبت یک درخواست
+
+        Returns:
+            0 اگر مجاز باشد، در غیر این صورت ثانیه‌های لازم تا درخواست بعدی
+        """
+        now = time.monotonic() if now is None else now
+        window = int(now // self.interval)
+        state = self._keys.get(key)
+        if state is None:
+            state = self._keys[key] = WindowState(window)
+        elif state.window != window:
+            state.previous = state.current if state.window == window - 1 else 0
+            state.current = 0
+            state.window = window
+
+        elapsed = now - window * self.interval
+        weight = 1 - elapsed / self.interval
+        if state.previous * weight + state.current >= self.limit:
+            if state.current >= self.limit or not state.previous:
+                return self.interval - elapsed
+            # زمانی که سهم پنجره قبلی به اندازه کافی کم شود
+            free_at = self.interval * (1 - (self.limit - state.current) /
+                                       state.previous)
+            return max(free_at - elapsed, 0.001)
+
+        state.current += 1
+        return 0
+
+    def count(self, key: Hashable, now: Optional[float] = None) -> int:
+        """تعداد تخمینی درخواست‌های ثبت‌شده در بازه اخیر"""
+        now = time.monotonic() if now is None else now
+        window = int(now // self.interval)
+        state = self._keys.get(key)
+        if state is None or state.window < window - 1:
+            return 0
+        if state.window == window - 1:
+            previous, current = state.current, 0
+        else:
+            previous, current = state.previous, state.current
+        weight = 1 - (now - window * self.interval) / self.interval
+        return round(previous * weight + current)
+
+    def evict(self, now: Optional[float] = None) -> int:
+        """حذف کلیدهایی که در دو پنجره اخیر درخواستی نداشته‌اند"""
+        now = time.monotonic() if now is None else now
+        window = int(now // self.interval)
+        idle = [
+            key for key, state in self._keys.items()
+            if state.window < window - 1
+        ]
+        for key in idle:
+            del self._keys[key]
+        return len(idle)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class BucketState:
+    """وضعیت یک کلید در سطل توکن"""
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class TokenBucketLimiter:
+    """
+    محدودکننده سطل توکن: ظرفیت `limit` و پر شدن یکنواخت در `interval` ثانیه
+
+    برخلاف پنجره لغزان اجازه انفجار کوتاه تا ظرفیت کامل را می‌دهد.
+    """
+
+    def __init__(self, limit: int, interval: float):
+        self.limit = limit
+        self.interval = interval
+        self.rate = limit / interval
+        self._keys: dict[Hashable, BucketState] = {}
+
+    def hit(self, key: Hashable, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        state = self._keys.get(key)
+        if state is None:
+            state = self._keys[key] = BucketState(self.limit, now)
+        else:
+            state.tokens = min(self.limit,
+                               state.tokens + (now - state.updated) * self.rate)
+            state.updated = now
+
+        if state.tokens < 1:
+            return (1 - state.tokens) / self.rate
+        state.tokens -= 1
+        return 0
+
+    def evict(self, now: Optional[float] = None) -> int:
+        """حذف کلیدهایی که سطلشان دوباره پر شده است"""
+        now = time.monotonic() if now is None else now
+        idle = [
+            key for key, state in self._keys.items()
+            if now - state.updated >= self.interval
+        ]
+        for key in idle:
+            del self._keys[key]
+        return len(idle)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+ALGORITHMS = {
+    "window": SlidingWindowLimiter,
+    "token": TokenBucketLimiter,
+}
+
+# محدودکننده‌های نام‌دار؛ دستورهایی با نام یکسان یک سهمیه مشترک دارند
+limiters: dict[str, SlidingWindowLimiter | TokenBucketLimiter] = {}
+
+
+def get_limiter(name: str,
+                limit: int,
+                interval: float,
+                algorithm: str = "window"):
+    """دریافت (یا ساخت) محدودکننده نام‌دار"""
+    limiter = limiters.get(name)
+    if limiter is None:
+        limiter = limiters[name] = ALGORITHMS[algorithm](limit, interval)
+    elif (limiter.limit, limiter.interval) != (limit, interval):
+        logger.warning(f"Rate limit bucket {name} already exists with "
+                       f"{limiter.limit}/{limiter.interval}s")
+    return limiter
+
+
+def retry_after_seconds(delay: float) -> int:
+    """ثانیه‌های انتظار برای نمایش به کاربر"""
+    return max(1, math.ceil(delay))
+
+
+async def evict_idle_keys() -> None:
+    evicted = sum(limiter.evict() for limiter in limiters.values())
+    if evicted:
+        logger.debug(f"Evicted {evicted} idle rate limit keys")
+
+
+run_periodically(RATE_LIMIT_EVICT_INTERVAL, evict_idle_keys)
@@ -0,0 +1,158 @@
+# utils\resilience.py
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# کدهای HTTP که نشان‌دهنده خطای موقت هستند
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """مدار باز است و درخواست بدون ارسال رد شد"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """تشخیص خطاهای موقت (قابل تکرار) از خطاهای دائمی"""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    response = getattr(error, "response", None)
+    code = (getattr(error, "code", None)
+            or getattr(error, "status_code", None)
+            or getattr(response, "status_code", None))
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    # خطاهای شبکه httpx (قطع اتصال، ریست و ...)
+    return type(error).__module__.startswith(("httpx", "httpcore"))
+
+
+class RetryPolicy:
+    """تکرار با تأخیر نمایی و jitter کامل"""
+
+    def __init__(self,
+                 attempts: int = 3,
+                 base_delay: float = 0.5,
+                 max_delay: float = 8.0):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay,
+                                     self.base_delay * 2**attempt))
+
+
+class CircuitBreaker:
+    """
+    قطع‌کننده مدار
+
+    بعد از `failure_threshold` خطای متوالی مدار باز می‌شود و تا
+    `reset_timeout` ثانیه درخواست‌ها فوراً رد می‌شوند؛ سپس یک درخواست
+    آزمایشی (نیمه‌باز) اجازه عبور دارد.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._state = self.CLOSED
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if (self._state == self.OPEN
+                and time.monotonic() - self.opened_at >= self.reset_timeout):
+            return self.HALF_OPEN
+        return self._state
+
+    def allow(self) -> bool:
+        """آیا درخواست جدید مجاز است"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._probing = False
+        self._state = self.CLOSED
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            logger.warning(f"Circuit opened after {self.failures} failures")
+            self._state = self.OPEN
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release(self) -> None:
+        """آزاد کردن جایگاه درخواست آزمایشی بدون تغییر وضعیت (مثلاً لغو)"""
+        self._probing = False
+
+    def info(self) -> dict:
+        remaining = 0
+        if self.state == self.OPEN:
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'retry_in': max(0, round(remaining))
+        }
+
+
+class LatencyTracker:
+    """نگهداری تأخیر آخرین درخواست‌ها برای محاسبه صدک‌ها"""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, q: float, min_samples: int = 20) -> Optional[float]:
+        if len(self._samples) < min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def hedged(func: Callable[[], Awaitable[T]],
+                 delay: Optional[float]) -> T:
+    """
+    درخواست پشتیبان (hedged request)
+
+    اگر درخواست اول تا `delay` ثانیه پاسخ ندهد، درخواست دوم ارسال و
+    اولین پاسخ موفق برگردانده می‌شود؛ درخواست دیگر لغو می‌شود.
+    """
+    pending = {asyncio.ensure_future(func())}
+    try:
+        if delay is not None:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                pending.add(asyncio.ensure_future(func()))
+
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,129 @@
+# utils\scheduler.py
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerBusy(Exception):
+    """صف پر است و درخواست پذیرفته نشد"""
+
+    def __init__(self, position: int):
+        super().__init__(f"Scheduler busy (position {position})")
+        self.position = position
+
+
+class PriorityScheduler:
+    """
+    صف اولویت‌دار برای کارهای سنگین (مثل فراخوانی Gemini)
+
+    - اولویت بر اساس سطح دسترسی (مالک > ادمین > ویژه > عادی)
+    - نوبت‌دهی چرخشی بین کاربران هم‌سطح تا یک کاربر صف را قبضه نکند
+    - رد درخواست وقتی عمق صف از حد مجاز بیشتر شود (مالک هرگز رد نمی‌شود)
+    """
+
+    def __init__(self, workers: int = 4, max_queue: int = 50):
+        self.workers = workers
+        self.max_queue = max_queue
+        # سطح -> (کاربر -> صف کارها)
+        self._queues: dict[int, OrderedDict[int, deque]] = {}
+        self._pending = 0
+        self._ready = asyncio.Condition()
+        self._tasks: list[asyncio.Task] = []
+        # ارجاع به تسک‌های اعلان تا پیش از اجرا توسط GC جمع‌آوری نشوند
+        self._notifiers: set[asyncio.Task] = set()
+        self.completed = 0
+        self.rejected = 0
+
+    def position(self, user_id: int, level: int) -> int:
+        """جایگاه تقریبی کار بعدی این کاربر در صف"""
+        ahead = sum(
+            len(jobs) for lvl, users in self._queues.items() if lvl > level
+            for jobs in users.values())
+        same_level = self._queues.get(level, {})
+        own = len(same_level.get(user_id, ()))
+        # در نوبت‌دهی چرخشی هر کاربر دیگر حداکثر own + 1 کار جلوتر دارد
+        ahead += sum(
+            min(len(jobs), own + 1) for uid, jobs in same_level.items()
+            if uid != user_id)
+        return ahead + own + 1
+
+    def submit(self, user_id: int, level: int,
+               func: Callable[[], Awaitable]) -> tuple[asyncio.Future, int]:
+        """
+        افزودن کار به صف
+
+        Returns:
+            (future نتیجه کار, جایگاه در صف)
+        Raises:
+            SchedulerBusy: اگر صف برای این سطح پر باشد
+        """
+        position = self.position(user_id, level)
+        limit = self.max_queue * (2 if level >= 2 else 1)
+        if level < 3 and self._pending >= limit:
+            self.rejected += 1
+            raise SchedulerBusy(position)
+
+        self._ensure_workers()
+        future = asyncio.get_running_loop().create_future()
+        users = self._queues.setdefault(level, OrderedDict())
+        users.setdefault(user_id, deque()).append((func, future))
+        self._pending += 1
+        notifier = asyncio.ensure_future(self._notify())
+        self._notifiers.add(notifier)
+        notifier.add_done_callback(self._notifiers.discard)
+        return future, position
+
+    def stats(self) -> dict:
+        return {
+            'pending': self._pending,
+            'completed': self.completed,
+            'rejected': self.rejected
+        }
+
+    async def _notify(self) -> None:
+        async with self._ready:
+            self._ready.notify()
+
+    def _ensure_workers(self) -> None:
+        self._tasks = [t for t in self._tasks if not t.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.ensure_future(self._worker()))
+
+    def _pop(self) -> Optional[tuple]:
+        for level in sorted(self._queues, reverse=True):
+            users = self._queues[level]
+            if not users:
+                continue
+            user_id, jobs = next(iter(users.items()))
+            job = jobs.popleft()
+            if jobs:
+                users.move_to_end(user_id)
+            else:
+                del users[user_id]
+            self._pending -= 1
+            return job
+        return None
+
+    async def _worker(self) -> None:
+        while True:
+            async with self._ready:
+                await self._ready.wait_for(lambda: self._pending > 0)
+                func, future = self._pop()
+
+            if future.cancelled():
+                continue
+
+            try:
+                result = await func()
+            except Exception as e:
+                logger.error(f"Scheduled job failed: {str(e)}")
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self.completed += 1
@@ -0,0 +1,134 @@
+# utils\streaming.py
+import asyncio
+import logging
+from typing import Optional
+from pyrogram.enums import ParseMode
+from pyrogram.errors import FloodWait, MessageNotModified
+from pyrogram.types import Message, InlineKeyboardMarkup
+from utils.helpers import find_split_point
+import config
+
+logger = logging.getLogger(__name__)
+
+# حداقل فاصله بین دو ویرایش (ثانیه) و حداقل کاراکتر جدید برای ویرایش بعدی
+STREAM_EDIT_INTERVAL = getattr(config, "STREAM_EDIT_INTERVAL", 1.5)
+STREAM_EDIT_MIN_CHARS = getattr(config, "STREAM_EDIT_MIN_CHARS", 60)
+
+CURSOR = " ▌"
+INTERRUPTED_NOTE = "\n\n⚠️ <i>پاسخ به دلیل قطع ارتباط ناقص ماند؛ لطفاً مجدد تلاش کنید.</i>"
+
+
+class StreamInterrupted(Exception):
+    """قطع شدن جریان بعد از ارسال بخشی از پاسخ"""
+
+
+class StreamingMessage:
+    """
+    ویرایش تدریجی یک پیام با متنی که در حال تولید است
+
+    ویرایش‌ها تجمیع می‌شوند تا از محدودیت تلگرام عبور نکنیم:
+    حداکثر یک ویرایش در هر `interval` ثانیه و فقط با حداقل `min_chars` کاراکتر جدید.
+
+    Parameters:
+        rollover: اگر True باشد با رسیدن به `max_length` ادامه متن در پیام جدید
+            ارسال می‌شود، در غیر این صورت ویرایش متوقف شده و متن کامل فقط در
+            `text` نگهداری می‌شود.
+    """
+
+    def __init__(self,
+                 message: Message,
+                 header: str = "",
+                 max_length: int = 3900,
+                 rollover: bool = True,
+                 interval: float = STREAM_EDIT_INTERVAL,
+                 min_chars: int = STREAM_EDIT_MIN_CHARS,
+                 parse_mode: Optional[ParseMode] = ParseMode.HTML):
+        self.message = message
+        self.messages = [message]
+        self.header = header
+        self.max_length = max_length
+        self.rollover = rollover
+        self.interval = interval
+        self.min_chars = min_chars
+        self.parse_mode = parse_mode
+        self.text = ""
+        self.overflowed = False
+        self.interrupted = False
+        self._offset = 0  # شروع بخش پیام فعلی در کل متن
+        self._shown = 0  # طول متنی که در پیام فعلی نمایش داده شده
+        self._last_edit = 0.0
+
+    @property
+    def part(self) -> str:
+        """متن مربوط به پیام فعلی"""
+        return self.text[self._offset:]
+
+    async def feed(self, piece: str) -> None:
+        """افزودن تکه جدید و ویرایش پیام در صورت نیاز"""
+        self.text += piece
+        if self.overflowed:
+            return
+
+        while len(self.part) > self.max_length:
+            if not self.rollover:
+                self.overflowed = True
+                await self._edit(self.part[:self.max_length], force=True)
+                return
+
+            cut = find_split_point(self.part, self.max_length)
+            await self._edit(self.part[:cut], force=True)
+            self._offset += cut
+            self.message = await self.message.reply(
+                self.part[:self.max_length] + CURSOR,
+                disable_web_page_preview=True)
+            self.messages.append(self.message)
+            self._shown = min(len(self.part), self.max_length)
+
+        now = asyncio.get_running_loop().time()
+        if (now - self._last_edit >= self.interval
+                and len(self.part) - self._shown >= self.min_chars):
+            await self._edit(self.part + CURSOR)
+
+    async def interrupt(self) -> None:
+        """علامت‌گذاری پاسخ به عنوان ناقص (قطع جریان در میانه پاسخ)"""
+        self.interrupted = True
+        await self.feed(INTERRUPTED_NOTE)
+
+    async def finish(self,
+                     reply_markup: Optional[InlineKeyboardMarkup] = None
+                     ) -> str:
+        """ویرایش نهایی پیام فعلی (بدون نشانگر) و بازگرداندن متن کامل"""
+        if not self.overflowed and self.part:
+            await self._edit(self.part, force=True, reply_markup=reply_markup)
+        return self.text
+
+    async def _edit(self,
+                    text: str,
+                    force: bool = False,
+                    reply_markup: Optional[InlineKeyboardMarkup] = None):
+        if self.message is self.messages[0]:
+            text = f"{self.header}{text}"
+        try:
+            await self.message.edit_text(text,
+                                         parse_mode=self.parse_mode,
+                                         disable_web_page_preview=True,
+                                         reply_markup=reply_markup)
+        except MessageNotModified:
+            pass
+        except FloodWait as e:
+            if not force:
+                # ویرایش میانی را رها می‌کنیم؛ ویرایش نهایی آن را جبران می‌کند
+                self._last_edit = asyncio.get_running_loop().time() + e.value
+                return
+            await asyncio.sleep(e.value)
+            await self.message.edit_text(text,
+                                         parse_mode=self.parse_mode,
+                                         disable_web_page_preview=True,
+                                         reply_markup=reply_markup)
+        except Exception as e:
+            if force:
+                raise
+            logger.warning(f"Streaming edit failed: {str(e)}")
+
+        self._shown = len(self.part)
+        self._last_edit = asyncio.get_running_loop().time()